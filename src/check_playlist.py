@@ -5,40 +5,407 @@ import re
 import sys
 import argparse
 import os
-from urllib.parse import urlparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import threading
+import queue
+import heapq
+import sqlite3
+import multiprocessing
+import json
+import math
+import random
+import socket
+import ssl
+import tracemalloc
+import mmap
+import hashlib
+import struct
+import zlib
+from array import array
+from collections import deque
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse, urljoin
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing.connection import Listener, Client
 import time
 
+try:
+    import aiohttp
+except ImportError:  # Only needed for --engine async
+    aiohttp = None
+
+try:
+    import httpx
+    import h2  # noqa: F401 -- httpx only speaks HTTP/2 with it installed
+except ImportError:  # Only needed for --engine http2 (pip install 'httpx[http2]')
+    httpx = None
+
+PROBE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+EXTINF_DURATION_RE = re.compile(rb'#EXTINF:[ \t]*([^\s,]*)')
+# A quoted value runs to its closing quote or, when that is missing, up to the
+# next ` key="` (so tvg-name="A tvg-id="a" keeps its tvg-id)
+_EXTINF_QUOTED_VALUE = rb'[^" \t]*(?:[ \t]+(?![^\s=,"]+=")[^" \t]*)*'
+_EXTINF_QUOTE_END = rb'(?:"|(?=[ \t]+[^\s=,"]+="))'
+_EXTINF_QUOTED = rb'"(' + _EXTINF_QUOTED_VALUE + rb')' + _EXTINF_QUOTE_END
+# One attribute: key="value" (or an unquoted key=value), after whitespace or
+# straight after the previous value's closing quote (tvg-name="A"tvg-id="a")
+EXTINF_ATTRIBUTE_RE = re.compile(rb'(?:[ \t]+|(?<="))([^\s=,"]+)=(?:' + _EXTINF_QUOTED + rb'|([^\s,"]*))')
+# A stray word between attributes, skipped
+EXTINF_BARE_WORD_RE = re.compile(rb'[ \t]+[^\s=,"]+(?=[ \t])')
+# Where the walk can't go on (a comma between attributes, a stray quote), the
+# next key="value" further on, as the old whole-line searches would find it
+EXTINF_NEXT_ATTRIBUTE_RE = re.compile(rb'(?<=[\s,"])([^\s=,"]+)=' + _EXTINF_QUOTED)
+# The same walk as scan_extinf, stopping at the first tvg-id, in a single match
+# (the duration is matched atomically, as scan_extinf never gives it back). It
+# doesn't skip ahead like EXTINF_NEXT_ATTRIBUTE_RE: when it finds no tvg-id on
+# a line that has one, the line goes through scan_extinf instead
+EXTINF_TVG_ID_RE = re.compile(
+    rb'#EXTINF:(?=([ \t]*[^\s,]*))\1'
+    rb'(?:(?:[ \t]+|(?<="))(?!tvg-id=)[^\s=,"]+=(?:' + rb'"' + _EXTINF_QUOTED_VALUE + _EXTINF_QUOTE_END + rb'|[^\s,"]*)'
+    rb'|[ \t]+[^\s=,"]+(?=[ \t]))*'
+    rb'(?:[ \t]+|(?<="))tvg-id=(?:' + _EXTINF_QUOTED + rb'|([^\s,"]*))')  # Groups 2 and 3: quoted or bare value
+
+class M3USource:
+    """A source playlist mapped into memory, which entries point into by byte offset
+
+    The file is mapped on first use and pickles as its path alone, so entries
+    can be handed to worker processes, which never read their metadata.
+    """
+    __slots__ = ('path', '_data')
+
+    def __init__(self, path, data=None):
+        self.path = path
+        self._data = data
+
+    @property
+    def data(self):
+        if self._data is None:
+            with open(self.path, 'rb') as f:
+                try:
+                    self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:  # An empty file can't be mapped
+                    self._data = b''
+        return self._data
+
+    def text(self, start, end):
+        """Decode the bytes between two offsets"""
+        return self.data[start:end].decode('utf-8', 'replace')
+
+    def __reduce__(self):
+        if self.path is None:
+            return (M3USource, (None, bytes(self._data)))
+        return (M3USource, (self.path,))
+
+class ExtInf:
+    """An #EXTINF line tokenized once into duration, attributes and display name
+
+    Nothing is copied out of the line: attribute values are kept as byte
+    offsets into its source and decoded on access. keys is shared by every
+    line with the same attributes in the same order, which in a single
+    playlist is nearly all.
+    """
+    __slots__ = ('source', 'start', 'end', 'duration', 'keys', 'spans', 'name_start')
+
+    def __init__(self, source, start, end, duration, keys, spans, name_start):
+        self.source = source
+        self.start = start  # Offsets of the line in source
+        self.end = end
+        self.duration = duration
+        self.keys = keys  # Attribute names in line order
+        self.spans = spans  # (start, end) of each value, flattened
+        self.name_start = name_start
+
+    def get(self, key, default=None):
+        """Return an attribute's value (tvg-id, tvg-logo, group-title, ...)"""
+        try:
+            index = self.keys.index(key)
+        except ValueError:
+            return default
+        return self.source.text(self.spans[2 * index], self.spans[2 * index + 1])
+
+    @property
+    def line(self):
+        return self.source.text(self.start, self.end)
+
+    @property
+    def attributes(self):
+        return {key: self.get(key) for key in self.keys}
+
+    @property
+    def name(self):
+        return self.source.text(self.name_start, self.end).strip()
+
+    def raw_replace(self, key, value):
+        """Return the line's bytes with an attribute's value replaced, everything else untouched
+
+        Every occurrence of a repeated attribute is replaced; value may be a
+        function of the occurrence's current value. The new value is always
+        written quoted, as it may contain spaces.
+        """
+        data = self.source.data
+        pieces = []
+        position = self.start
+        for index, name in enumerate(self.keys):
+            if name != key:
+                continue
+            start, end = self.spans[2 * index], self.spans[2 * index + 1]
+            new_value = value(self.source.text(start, end)) if callable(value) else value
+            if data[start - 1:start] == b'"':
+                start -= 1
+                if data[end:end + 1] == b'"':
+                    end += 1
+            pieces += (data[position:start], b'"' + new_value.encode('utf-8') + b'"')
+            position = end
+        pieces.append(data[position:self.end])
+        return b''.join(pieces)
+
+    def replace(self, key, value):
+        """Return the line with an attribute's value replaced, everything else untouched"""
+        return self.raw_replace(key, value).decode('utf-8', 'replace')
+
+EXTINF_KEY_SETS = {}
+
+def scan_extinf(source, start, end):
+    """Tokenize the #EXTINF line at source[start:end] in one pass: #EXTINF:<duration> key="value" ...,<name>
+
+    Returns None for a line without the colon, which has no fields to read.
+    """
+    data = source.data
+    match = EXTINF_DURATION_RE.match(data, start, end)
+    if not match:
+        return None
+    duration = sys.intern(match.group(1).decode('utf-8', 'replace'))
+    position = match.end()
+    keys = []
+    spans = []
+    walk_end = None  # Where the walk first had to skip ahead
+    while True:
+        match = EXTINF_ATTRIBUTE_RE.match(data, position, end)
+        if match:
+            value_group = 2 if match.group(2) is not None else 3
+        else:
+            match = EXTINF_BARE_WORD_RE.match(data, position, end)
+            if match:
+                position = match.end()
+                continue
+            # Malformed header: skip ahead to the next quoted attribute, if any
+            if walk_end is None:
+                walk_end = position
+            match = EXTINF_NEXT_ATTRIBUTE_RE.search(data, position, end)
+            if not match:
+                break
+            value_group = 2
+        keys.append(match.group(1))
+        spans += match.span(value_group)
+        position = match.end()
+    keys = tuple(keys)
+    decoded_keys = EXTINF_KEY_SETS.get(keys)
+    if decoded_keys is None:
+        decoded_keys = EXTINF_KEY_SETS[keys] = tuple(key.decode('utf-8', 'replace') for key in keys)
+    # The display name follows the first comma after the attributes; if the
+    # skipped-ahead ones were really part of the name, the first after the walk
+    comma = data.find(b',', position, end)
+    if comma < 0 and walk_end is not None:
+        comma = data.find(b',', walk_end, end)
+    return ExtInf(source, start, end, duration, decoded_keys, tuple(spans), comma + 1 if comma >= 0 else end)
+
+def parse_extinf(line):
+    """Tokenize an #EXTINF line given as a string"""
+    data = line.encode('utf-8')
+    return scan_extinf(M3USource(None, data), 0, len(data))
+
+# Lines end in \n, \r\n or a bare \r, as with universal newlines
+M3U_LINE_RE = re.compile(rb'[^\r\n]+')
+# The ASCII characters str.strip() removes, as the ints indexing bytes gives
+M3U_WHITESPACE = frozenset(b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f')
+
+def scan_m3u(data, position=0, end=None):
+    """Yield (metadata spans, URL span) for each entry in an M3U buffer, from position up to end
+
+    Spans are (start, end) byte offsets of whitespace-stripped lines. The
+    metadata is the #EXTINF line and the #EXTVLCOPT lines after it (an
+    #EXTINF starts over); other comment lines are skipped.
+    """
+    metadata = []
+    for line in M3U_LINE_RE.finditer(data, position, len(data) if end is None else end):
+        start, end = line.span()
+        while start < end and data[start] in M3U_WHITESPACE:
+            start += 1
+        while end > start and data[end - 1] in M3U_WHITESPACE:
+            end -= 1
+        if start == end:
+            continue
+        if data[start] != 35:  # Not '#': this is a URL
+            yield metadata, (start, end)
+            metadata = []
+        elif data[start:start + 7] == b'#EXTINF':
+            metadata = [(start, end)]
+        elif data[start:start + 10] == b'#EXTVLCOPT':
+            metadata.append((start, end))
+
+class PlaylistEntry:
+    """One URL of a source playlist with the metadata lines before it
+
+    Entries double as the URL records of their channel group, so a URL and
+    its metadata are held once however the entry is reached. Only the URL
+    and tvg-id are decoded up front: the metadata stays in the mapped source,
+    found again from offset (where the entry's lines begin) by the few
+    entries that are written out. host is the interned hostname.
+    """
+    __slots__ = ('source', 'offset', 'url', 'tvg_id', '_extinf', 'original_index', 'source_file', 'host')
+
+    def __init__(self, source, offset, url, tvg_id=None, original_index=None, source_file=None, host=None):
+        self.source = source
+        self.offset = offset
+        self.url = url
+        self.tvg_id = tvg_id  # None without one (or an empty one)
+        self._extinf = False  # Not tokenized yet
+        self.original_index = original_index
+        self.source_file = source_file
+        self.host = host
+
+    def spans(self):
+        """Return the (start, end) offsets of the metadata lines and of the URL line"""
+        return next(scan_m3u(self.source.data, self.offset))
+
+    @property
+    def extinf(self):
+        """The parsed #EXTINF line (None without one), tokenized on first use"""
+        if self._extinf is False:
+            metadata, _ = self.spans()
+            self._extinf = None
+            if metadata and self.source.data[metadata[0][0]:metadata[0][0] + 7] == b'#EXTINF':
+                self._extinf = scan_extinf(self.source, *metadata[0])
+        return self._extinf
+
+    @property
+    def metadata(self):
+        """The #EXTINF/#EXTVLCOPT lines, #EXTINF first, decoded"""
+        metadata, _ = self.spans()
+        return tuple(self.source.text(start, end) for start, end in metadata)
+
+    def raw_metadata(self, source_prefix=None):
+        """The metadata lines as bytes, newline-terminated; source_prefix goes in front of each group-title"""
+        data = self.source.data
+        metadata, _ = self.spans()
+        lines = [data[start:end] for start, end in metadata]
+        extinf = self.extinf
+        if source_prefix is not None and extinf and 'group-title' in extinf.keys:
+            lines[0] = extinf.raw_replace('group-title', lambda current: prefix_group_title(current, source_prefix))
+        return b''.join(line + b'\n' for line in lines)
+
+    def raw_url(self):
+        """The URL line as bytes, newline-terminated"""
+        _, (start, end) = self.spans()
+        return self.source.data[start:end] + b'\n'
+
+class ChannelGroup:
+    """Entries sharing a tvg-id (or one entry without it), tried in order until one works"""
+    __slots__ = ('tvg_id', 'urls', 'original_index')
+
+    def __init__(self, tvg_id, urls, original_index):
+        self.tvg_id = tvg_id
+        self.urls = urls  # PlaylistEntry list in original order
+        self.original_index = original_index
+
+    @property
+    def metadata(self):
+        """Metadata of the first occurrence, which the group's output entry carries"""
+        return self.urls[0].metadata
+
+# Chunks one parse process takes from a large file, and the input size below
+# which starting processes costs more than it saves
+PARSE_CHUNK_BYTES = 8 * 1024 * 1024
+PARSE_PARALLEL_MIN_BYTES = 32 * 1024 * 1024
+
+def parse_m3u_span(file_path, start=0, end=None):
+    """Parse the entries of an M3U file between two byte offsets
+
+    start must be the beginning of a line. Returns parallel lists of entry
+    offsets, URLs, tvg-ids and hosts: plain lists are cheap to send back
+    from a parse process, and the caller builds the entries.
+    """
+    source = M3USource(file_path)
+    data = source.data
+    offsets, urls, tvg_ids, hosts = [], [], [], []
+    tvg_id_strings = {}  # One string per tvg-id, shared by its entries
+    
+    for metadata, (url_start, url_end) in scan_m3u(data, start, end):
+        tvg_id = None
+        if metadata:
+            value = None
+            match = EXTINF_TVG_ID_RE.match(data, *metadata[0])
+            if match:
+                value = match.group(2) if match.group(2) is not None else match.group(3)
+            elif data.find(b'tvg-id=', *metadata[0]) >= 0:
+                # Malformed header the single match can't walk; the tokenizer skips ahead
+                extinf = scan_extinf(source, *metadata[0])
+                if extinf and 'tvg-id' in extinf.keys:
+                    index = extinf.keys.index('tvg-id')
+                    value = data[extinf.spans[2 * index]:extinf.spans[2 * index + 1]]
+            if value:
+                    tvg_id = tvg_id_strings.get(value)
+                    if tvg_id is None:
+                        tvg_id = tvg_id_strings[value] = value.decode('utf-8', 'replace')
+        url = data[url_start:url_end].decode('utf-8', 'replace')
+        offsets.append(metadata[0][0] if metadata else url_start)
+        urls.append(url)
+        tvg_ids.append(tvg_id)
+        hosts.append(sys.intern(get_url_host(url)))
+    
+    return offsets, urls, tvg_ids, hosts
+
+def split_m3u_chunks(data, chunk_bytes=PARSE_CHUNK_BYTES):
+    """Split an M3U buffer into (start, end) chunks of about chunk_bytes
+
+    Every chunk but the first begins on an #EXTINF line (after \n or a bare
+    \r, see M3U_LINE_RE). An #EXTINF drops
+    whatever metadata came before it, so each chunk parses exactly as it
+    would in one pass over the whole buffer.
+    """
+    bounds = [0]
+    while True:
+        cuts = [cut for cut in (data.find(b'\n#EXTINF', bounds[-1] + chunk_bytes),
+                                data.find(b'\r#EXTINF', bounds[-1] + chunk_bytes)) if cut >= 0]
+        if not cuts:
+            break
+        bounds.append(min(cuts) + 1)
+    bounds.append(len(data))
+    return list(zip(bounds, bounds[1:]))
+
+def build_playlist_entries(source, columns, source_file=None, first_index=0, tvg_ids=None):
+    """Build entries from parse_m3u_span's columns, numbered from first_index
+
+    tvg_ids, if given, maps each tvg-id to one shared string across calls.
+    """
+    offsets, urls, tvg_id_column, hosts = columns
+    if tvg_ids is not None:
+        tvg_id_column = [tvg_ids.setdefault(tvg_id, tvg_id) if tvg_id else tvg_id for tvg_id in tvg_id_column]
+    hosts = [sys.intern(host) for host in hosts]
+    return [PlaylistEntry(source, offset, url, tvg_id, index, source_file, host)
+            for index, offset, url, tvg_id, host in zip(range(first_index, first_index + len(urls)), offsets, urls, tvg_id_column, hosts)]
+
 def parse_m3u_with_metadata(file_path):
-    """Parse M3U file and return list of entries with metadata and URLs"""
-    entries = []
-    current_metadata = []
-    
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if line.startswith('#EXTINF'):
-                current_metadata = [line]
-            elif line.startswith('#EXTVLCOPT'):
-                current_metadata.append(line)
-            elif line and not line.startswith('#'):
-                # This is a URL
-                entries.append({
-                    'metadata': current_metadata,
-                    'url': line
-                })
-                current_metadata = []
-    
-    return entries
+    """Parse M3U file and return list of entries with metadata and URLs
+
+    The file is memory-mapped and scanned as bytes rather than read into
+    lines; entries record where their lines start. Only URLs and tvg-ids are
+    decoded, the rest waits for the entries that get written.
+    """
+    return build_playlist_entries(M3USource(file_path), parse_m3u_span(file_path))
 
 def extract_tvg_id(metadata_lines):
     """Extract tvg-id from metadata lines"""
     for line in metadata_lines:
         if line.startswith('#EXTINF'):
-            # Look for tvg-id="value" pattern
-            match = re.search(r'tvg-id="([^"]*)"', line)
-            if match:
-                return match.group(1)
+            extinf = parse_extinf(line)
+            tvg_id = extinf.get('tvg-id') if extinf else None
+            if tvg_id is not None:
+                return tvg_id
     return None
 
 
@@ -66,198 +433,2322 @@ def get_source_prefix(filename):
     base_name = filename.split('.')[0]
     return base_name.capitalize()
 
+GROUP_NAME_PUNCTUATION_RE = re.compile(r'[^\w\s\-_]', flags=re.UNICODE)
+WHITESPACE_RUN_RE = re.compile(r'\s+')
+
 def sanitize_group_name(group_name):
     """Sanitize group-title for Android app compatibility"""
     if not group_name:
         return group_name
     
-    import re
-    
     # Replace problematic punctuation with spaces, preserve Unicode letters/digits
     # Keep basic punctuation that's commonly supported: space, dash, underscore
-    sanitized = re.sub(r'[^\w\s\-_]', ' ', group_name, flags=re.UNICODE)
+    sanitized = GROUP_NAME_PUNCTUATION_RE.sub(' ', group_name)
     
     # Clean up multiple consecutive spaces
-    sanitized = re.sub(r'\s+', ' ', sanitized)
+    sanitized = WHITESPACE_RUN_RE.sub(' ', sanitized)
     
     # Strip leading/trailing whitespace
     sanitized = sanitized.strip()
     
     return sanitized
 
-def add_source_prefix_to_group_title(metadata_lines, source_prefix):
-    """Add source prefix to group-title in metadata lines"""
+def prefix_group_title(current_group, source_prefix):
+    """Sanitize a group-title and put the source prefix in front of it"""
+    # Sanitize the group name for Android compatibility
+    if current_group:
+        current_group = sanitize_group_name(current_group)
+    
+    if current_group and not current_group.startswith(source_prefix):
+        return f"{source_prefix} {current_group}"
+    elif not current_group:
+        return source_prefix
+    else:
+        return current_group  # Already has prefix
+
+def add_source_prefix_to_group_title(metadata_lines, source_prefix, extinf=None):
+    """Add source prefix to group-title in metadata lines
+
+    extinf is the parsed #EXTINF line of metadata_lines, if already at hand.
+    """
     modified_lines = []
     
     for line in metadata_lines:
-        if line.startswith('#EXTINF') and 'group-title=' in line:
-            # Find and modify group-title
-            import re
-            def replace_group_title(match):
-                current_group = match.group(1)
-                
-                # Sanitize the group name for Android compatibility
-                if current_group:
-                    current_group = sanitize_group_name(current_group)
-                
-                if current_group and not current_group.startswith(source_prefix):
-                    sanitized_group = f"{source_prefix} {current_group}"
-                elif not current_group:
-                    sanitized_group = source_prefix
-                else:
-                    sanitized_group = current_group  # Already has prefix
-                
-                return f'group-title="{sanitized_group}"'
+        if line.startswith('#EXTINF'):
+            if extinf is None or extinf.line != line:
+                extinf = parse_extinf(line)
+            if not extinf or 'group-title' not in extinf.keys:
+                modified_lines.append(line)
+                continue
             
-            modified_line = re.sub(r'group-title="([^"]*)"', replace_group_title, line)
-            modified_lines.append(modified_line)
+            modified_lines.append(extinf.replace('group-title', lambda current: prefix_group_title(current, source_prefix)))
         else:
             modified_lines.append(line)
     
     return modified_lines
 
-def check_url(url, timeout=10, max_retries=3):
-    """Check if a URL is accessible with retry logic"""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-    }
-    
-    last_error = None
+class ProbeSessionPool:
+    """Per-worker requests sessions sharing one keep-alive connection pool"""
+
+    def __init__(self, max_workers=20):
+        # One adapter mounted on every worker's session, so a connection opened by
+        # any worker can be reused by the next probe to the same host
+        self.adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers * 4, pool_maxsize=max_workers)
+        self.adapter.poolmanager.pools.dispose_func = self._retire_pool
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections_opened = 0
+        self.requests_sent = 0
+
+    def session(self):
+        """Return the calling worker's session, creating it on first use"""
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            self.local.session = session
+        return session
+
+    def _retire_pool(self, pool):
+        # Host pools are evicted LRU-style; keep their counters before closing
+        with self.lock:
+            self.connections_opened += pool.num_connections
+            self.requests_sent += pool.num_requests
+        pool.close()
+
+    def close(self):
+        """Close all pooled connections and return connection counters"""
+        self.adapter.poolmanager.clear()
+        return {
+            'connections_opened': self.connections_opened,
+            'connections_reused': self.requests_sent - self.connections_opened
+        }
+
+def normalize_url(url):
+    """Normalize a URL for cache keys: lowercase scheme/host, no default port or fragment"""
+    try:
+        parsed = urlparse(url.strip())
+        port = parsed.port
+    except ValueError:
+        return url.strip()
+    netloc = (parsed.hostname or '').lower()
+    if parsed.username or parsed.password:
+        netloc = f"{parsed.netloc.rsplit('@', 1)[0]}@{netloc}"
+    if port and port != {'http': 80, 'https': 443}.get(parsed.scheme.lower()):
+        netloc = f"{netloc}:{port}"
+    return parsed._replace(scheme=parsed.scheme.lower(), netloc=netloc, fragment='').geturl()
+
+def probe_key(url, headers):
+    """Identity of a probe: normalized URL plus the request header set"""
+    return normalize_url(url), json.dumps(headers, sort_keys=True)
+
+class ProbeCache:
+    """SQLite cache of probe results with separate TTLs for working and failed URLs"""
+
+    def __init__(self, path, ttl, negative_ttl=0):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.pending = []
+        self.hits = 0
+        self.misses = 0
+
+        # Shared by worker threads; every access goes through self.lock
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS probes ('
+            'url TEXT, headers TEXT, working INTEGER, status TEXT, status_code INTEGER, '
+            'latency REAL, checked_at REAL, error_class TEXT, PRIMARY KEY (url, headers))'
+        )
+        try:
+            # Caches written before error classes existed
+            self.db.execute('ALTER TABLE probes ADD COLUMN error_class TEXT')
+        except sqlite3.OperationalError:
+            pass
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS host_methods (host TEXT PRIMARY KEY, method TEXT, checked_at REAL)'
+        )
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS host_latencies (host TEXT PRIMARY KEY, latency REAL, checked_at REAL)'
+        )
+        self.db.execute('DELETE FROM probes WHERE checked_at < ?', (time.time() - max(ttl, negative_ttl),))
+        self.db.execute('DELETE FROM host_methods WHERE checked_at < ?', (time.time() - ttl,))
+        self.db.execute('DELETE FROM host_latencies WHERE checked_at < ?', (time.time() - ttl,))
+        self.db.commit()
+
+    @staticmethod
+    def _key(url, headers):
+        return probe_key(url, headers)
+
+    def get(self, url, headers):
+        """Return a fresh cached (status, status_code, error_class) for the URL, or None"""
+        with self.lock:
+            row = self.db.execute(
+                'SELECT working, status, status_code, checked_at, error_class FROM probes WHERE url = ? AND headers = ?',
+                self._key(url, headers)
+            ).fetchone()
+
+            if row:
+                working, status, status_code, checked_at, error_class = row
+                ttl = self.ttl if working else self.negative_ttl
+                if time.time() - checked_at < ttl:
+                    self.hits += 1
+                    return f"{status} (cached)", status_code, error_class
+
+            self.misses += 1
+            return None
+
+    def put(self, url, headers, status, status_code, latency, error_class=None):
+        """Record a probe result; writes are batched"""
+        with self.lock:
+            self.pending.append(self._key(url, headers) + ("Working" in status, status, status_code, latency, time.time(), error_class))
+            if len(self.pending) >= 500:
+                self._flush()
+
+    def get_host_methods(self):
+        """Return {host: probe method} learned by earlier runs"""
+        with self.lock:
+            return dict(self.db.execute('SELECT host, method FROM host_methods'))
+
+    def put_host_method(self, host, method):
+        """Remember the probe method that works for a host"""
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO host_methods (host, method, checked_at) VALUES (?, ?, ?)',
+                            (host, method, time.time()))
+            self.db.commit()
+
+    def get_host_latencies(self):
+        """Return {host: latency percentile in seconds} measured by earlier runs"""
+        with self.lock:
+            return dict(self.db.execute('SELECT host, latency FROM host_latencies'))
+
+    def put_host_latencies(self, latencies):
+        """Remember each host's latency percentile for later runs' adaptive timeouts"""
+        now = time.time()
+        with self.lock:
+            self.db.executemany('INSERT OR REPLACE INTO host_latencies (host, latency, checked_at) VALUES (?, ?, ?)',
+                                [(host, latency, now) for host, latency in latencies.items()])
+            self.db.commit()
+
+    def close(self):
+        """Write any pending results and close the database"""
+        with self.lock:
+            self._flush()
+            self.db.close()
+
+    def _flush(self):
+        self.db.executemany('INSERT OR REPLACE INTO probes (url, headers, working, status, status_code, latency, checked_at, error_class) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', self.pending)
+        self.db.commit()
+        self.pending = []
+
+REDIRECT_STATUS_CODES = (301, 302, 307, 308)
+
+# Probe methods, cheapest first: HEAD, GET for the first bytes, GET closed after the first chunk
+METHOD_LADDER = ('head', 'range', 'stream')
+# Answers that often mean "this origin doesn't like the method", not "the stream is gone"
+METHOD_FALLBACK_STATUS_CODES = (400, 403, 404, 405, 416, 501)
+# The ones that still do on a host where HEAD has already worked
+METHOD_REFUSED_STATUS_CODES = (405, 501)
+RANGE_HEADERS = dict(PROBE_HEADERS, Range='bytes=0-15')
+STREAM_CHUNK_SIZE = 1024
+
+# Retry policy per error class: (extra attempts, base delay in seconds).
+# A delay of None uses --retry-backoff; -r still caps the total attempts.
+RETRY_POLICY = {
+    'dns': (0, None),         # NXDOMAIN won't fix itself within a run
+    'tls': (0, None),         # Bad certificates/handshakes are permanent
+    'http_4xx': (0, None),    # 404/410/451 and friends are final answers
+    'refused': (1, 1.0),
+    'timeout': (1, None),
+    'connection': (2, None),  # Resets and other transient socket errors
+    'http_429': (2, 2.0),
+    'http_5xx': (2, None),
+    'http_other': (2, None),
+    'error': (2, None),
+    'hls': (0, None),
+}
+
+# Error classes that count towards opening an origin's circuit breaker
+BREAKER_ERROR_CLASSES = ('timeout', 'refused', 'connection')
+
+# Answers that mean "slow down": the probe is parked and the host's probe rate is cut
+THROTTLE_STATUS_CODES = (429, 503)
+THROTTLE_MAX_PARKS = 5        # Times one probe is parked before it counts as a failure
+THROTTLE_MAX_WAIT = 60        # Longest Retry-After honoured, in seconds
+THROTTLE_MIN_INTERVAL = 0.1   # Gap between probe starts after the first cut
+THROTTLE_MAX_INTERVAL = 10
+THROTTLE_BURST_WINDOW = 1.0   # Throttled answers this close together are one burst (one cut)
+THROTTLE_BURST_INTERVALS = 8  # ...or this many pacing intervals, when that is longer
+THROTTLE_RATE_STEP = 0.5      # Probes/second regained per good answer from a throttled host
+
+def is_working_status_code(status_code):
+    """Return True for status codes that count as a working stream"""
+    return status_code in (200, 206) or status_code in REDIRECT_STATUS_CODES
+
+def classify_status_code(status_code):
+    """Return the error class for an HTTP status, or None if it counts as working"""
+    if is_working_status_code(status_code):
+        return None
+    if status_code == 429:
+        return 'http_429'
+    if 400 <= status_code < 500:
+        return 'http_4xx'
+    if 500 <= status_code < 600:
+        return 'http_5xx'
+    return 'http_other'
+
+def classify_os_error(exc):
+    """Find the socket-level cause of a client exception; returns (error_class, label) or None"""
+    seen = set()
+    pending = [exc]
+    while pending:
+        error = pending.pop()
+        if error is None or id(error) in seen:
+            continue
+        seen.add(id(error))
+
+        if isinstance(error, socket.gaierror):
+            return 'dns', "DNS Error"
+        if isinstance(error, (ssl.SSLError, ssl.CertificateError)):
+            return 'tls', "TLS Error"
+        if isinstance(error, ConnectionRefusedError):
+            return 'refused', "Connection Refused"
+
+        # requests/urllib3 and aiohttp wrap the OS error a few levels deep
+        pending.extend((error.__cause__, error.__context__, getattr(error, 'os_error', None)))
+        reason = getattr(error, 'reason', None)
+        if isinstance(reason, BaseException):
+            pending.append(reason)
+    return None
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when.tzinfo is None:
+        # "-0000" dates parse as naive; HTTP dates are always GMT
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, when.timestamp() - time.time())
+
+def http_probe_result(status_code, headers):
+    """Probe result for an HTTP answer: (status_code, error_class, None, retry_after)"""
+    retry_after = parse_retry_after(headers.get('Retry-After')) if status_code in THROTTLE_STATUS_CODES else None
+    return status_code, classify_status_code(status_code), None, retry_after
+
+def parse_retry_policy_override(value):
+    """Parse a CLASS=RETRIES[:DELAY] retry policy override for argparse"""
+    error_class, _, policy = value.partition('=')
+    retries, _, delay = policy.partition(':')
+    if error_class not in RETRY_POLICY or not retries.isdigit():
+        raise argparse.ArgumentTypeError(f"expected CLASS=RETRIES[:DELAY] with CLASS in {', '.join(RETRY_POLICY)}, got '{value}'")
+    try:
+        return error_class, (int(retries), float(delay) if delay else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid delay in '{value}'")
+
+def format_probe_status(status_code, error, attempts):
+    """Build the status string for a URL's final probe outcome"""
+    if error:
+        return f"✗ {error} after {attempts} tries"
+    if status_code in (200, 206):
+        return "✓ Working" if attempts == 1 else f"✓ Working (retry {attempts})"
+    if status_code in REDIRECT_STATUS_CODES:
+        return "✓ Working (redirected)" if attempts == 1 else f"✓ Working (redirected, retry {attempts})"
+    return f"✗ Failed ({status_code}) after {attempts} tries"
+
+def next_probe_method(method, status_code, head_confirmed=False):
+    """Return the next rung of the method ladder after `method` got status_code, or None
+
+    head_confirmed says HEAD has answered 2xx/3xx on this host before; a 4xx
+    to HEAD there is taken as the URL's own answer rather than a refusal.
+    """
+    if status_code not in METHOD_FALLBACK_STATUS_CODES:
+        return None
+    if method == 'head' and head_confirmed and status_code not in METHOD_REFUSED_STATUS_CODES:
+        return None
+    position = METHOD_LADDER.index(method) + 1
+    return METHOD_LADDER[position] if position < len(METHOD_LADDER) else None
+
+def retry_delay(attempt, backoff=0.5, max_delay=30):
+    """Exponential backoff with jitter before retry number `attempt`"""
+    return min(max_delay, backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+
+def probe_url_once(url, timeout=10, session=None, method='head'):
+    """Send a single probe with a METHOD_LADDER method; returns (status_code, error_class, error, retry_after)
+
+    timeout is in seconds, or a (connect, read) tuple. retry_after is the
+    Retry-After delay of a 429/503 answer, or None.
+    """
+    http = session or requests
     
-    for attempt in range(max_retries):
+    try:
+        # Set timeout and allow redirects
+        if method == 'head':
+            response = http.head(url, headers=PROBE_HEADERS, timeout=timeout, allow_redirects=True)
+        else:
+            # Streamed so closing the response never downloads more than we read
+            headers = RANGE_HEADERS if method == 'range' else PROBE_HEADERS
+            with http.get(url, headers=headers, timeout=timeout, stream=True) as response:
+                if method == 'stream' and is_working_status_code(response.status_code):
+                    next(response.iter_content(STREAM_CHUNK_SIZE), None)
+        return http_probe_result(response.status_code, response.headers)
+    except requests.exceptions.Timeout:
+        return None, 'timeout', "Timeout", None
+    except requests.exceptions.RequestException as e:
+        os_error = classify_os_error(e)
+        if os_error:
+            return (None,) + os_error + (None,)
+        if isinstance(e, requests.exceptions.ConnectionError):
+            return None, 'connection', "Connection Error", None
+        return None, 'error', f"Error: {str(e)[:30]}", None
+    except Exception as e:
+        return None, 'error', f"Unexpected Error: {str(e)[:30]}", None
+
+async def async_probe_url_once(session, url, method='head', timeout=None):
+    """Async counterpart of probe_url_once using a shared aiohttp session
+
+    A (connect, read) timeout overrides the session's for this request.
+    """
+    options = {}
+    if timeout:
+        options['timeout'] = aiohttp.ClientTimeout(total=None, sock_connect=timeout[0], sock_read=timeout[1])
+    try:
+        if method == 'head':
+            request = session.head(url, allow_redirects=True, **options)
+        else:
+            request = session.get(url, headers={'Range': RANGE_HEADERS['Range']} if method == 'range' else None, **options)
+        async with request as response:
+            if method == 'stream' and is_working_status_code(response.status):
+                await response.content.read(STREAM_CHUNK_SIZE)
+            return http_probe_result(response.status, response.headers)
+    except asyncio.TimeoutError:
+        return None, 'timeout', "Timeout", None
+    except aiohttp.ClientError as e:
+        os_error = classify_os_error(e)
+        if os_error:
+            return (None,) + os_error + (None,)
+        if isinstance(e, aiohttp.ClientConnectionError):
+            return None, 'connection', "Connection Error", None
+        return None, 'error', f"Error: {str(e)[:30]}", None
+    except Exception as e:
+        return None, 'error', f"Unexpected Error: {str(e)[:30]}", None
+
+async def http2_probe_url_once(client, url, trace=None, method='head', timeout=None):
+    """Async counterpart of probe_url_once on an httpx client that negotiates HTTP/2
+
+    A (connect, read) timeout overrides the client's for this request.
+    """
+    extensions = {'trace': trace} if trace else None
+    request_timeout = httpx.Timeout(timeout[1], connect=timeout[0], pool=None) if timeout else httpx.USE_CLIENT_DEFAULT
+    try:
+        if method == 'head':
+            response = await client.head(url, extensions=extensions, timeout=request_timeout)
+        else:
+            headers = {'Range': RANGE_HEADERS['Range']} if method == 'range' else None
+            async with client.stream('GET', url, headers=headers, extensions=extensions, timeout=request_timeout) as response:
+                if method == 'stream' and is_working_status_code(response.status_code):
+                    async for chunk in response.aiter_raw(STREAM_CHUNK_SIZE):
+                        break
+        return http_probe_result(response.status_code, response.headers)
+    except httpx.TimeoutException:
+        return None, 'timeout', "Timeout", None
+    except httpx.HTTPError as e:
+        os_error = classify_os_error(e)
+        if os_error:
+            return (None,) + os_error + (None,)
+        if isinstance(e, httpx.TransportError):
+            return None, 'connection', "Connection Error", None
+        return None, 'error', f"Error: {str(e)[:30]}", None
+    except Exception as e:
+        return None, 'error', f"Unexpected Error: {str(e)[:30]}", None
+
+# --deep: caps per fetched playlist and for the first media segment
+HLS_PLAYLIST_MAX_BYTES = 64 * 1024
+HLS_SEGMENT_BYTES = 4096
+# Cache key for deep results, so they never mix with plain HEAD/GET results
+DEEP_CACHE_HEADERS = dict(PROBE_HEADERS, **{'X-Probe-Mode': 'deep'})
+
+def parse_hls_playlist(data, truncated=False):
+    """Find where an HLS playlist leads; returns ('variant', uri), ('segment', uri) or (None, None)
+
+    For a master playlist the lowest-bandwidth variant is picked, as the
+    cheapest one to check. A truncated playlist drops its partial last line.
+    """
+    lines = data.decode('utf-8', errors='replace').lstrip('\ufeff').splitlines()
+    if truncated:
+        lines = lines[:-1]
+    if not lines or not lines[0].strip().startswith('#EXTM3U'):
+        return None, None
+
+    variants = []
+    pending_tag = None
+    for line in lines[1:]:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-STREAM-INF'):
+            bandwidth = re.search(r'BANDWIDTH=(\d+)', line)
+            pending_tag = ('variant', int(bandwidth.group(1)) if bandwidth else math.inf)
+        elif line.startswith('#EXTINF'):
+            pending_tag = ('segment', 0)
+        elif not line.startswith('#') and pending_tag:
+            kind, bandwidth = pending_tag
+            if kind == 'segment' and not variants:
+                return 'segment', line
+            if kind == 'variant':
+                variants.append((bandwidth, len(variants), line))
+            pending_tag = None
+
+    if variants:
+        return 'variant', min(variants)[2]
+    return None, None
+
+class HlsValidator:
+    """Deep check of .m3u8 URLs: master playlist, one media playlist, first segment
+
+    Each validated URL gets its own byte and time budget. Parsed playlists are
+    shared across the run, so a variant or master referenced by several
+    channels is fetched once. The walk is a generator of fetch requests so
+    the thread and asyncio engines can drive it with their own HTTP clients.
+    """
+
+    def __init__(self, byte_budget=256 * 1024, time_budget=15):
+        self.byte_budget = byte_budget
+        self.time_budget = time_budget
+        self.playlists = {}  # playlist URL -> (status_code, kind, resolved next URL)
+        self.lock = threading.Lock()
+        self.validated = 0
+        self.failed = 0
+        self.playlist_hits = 0
+        self.bytes_fetched = 0
+
+    @staticmethod
+    def applies_to(url):
+        """Return True for URLs deep mode validates (HLS playlists)"""
         try:
-            # Set timeout and allow redirects
-            response = requests.head(url, headers=headers, timeout=timeout, allow_redirects=True)
-            
-            if response.status_code == 200:
-                if attempt > 0:
-                    return url, f"✓ Working (retry {attempt + 1})", response.status_code
-                else:
-                    return url, "✓ Working", response.status_code
-            elif response.status_code in [301, 302, 307, 308]:
-                if attempt > 0:
-                    return url, f"✓ Working (redirected, retry {attempt + 1})", response.status_code
-                else:
-                    return url, "✓ Working (redirected)", response.status_code
-            else:
-                last_error = f"HTTP {response.status_code}"
-                if attempt == max_retries - 1:  # Last attempt
-                    return url, f"✗ Failed ({response.status_code}) after {max_retries} tries", response.status_code
-                
-        except requests.exceptions.Timeout:
-            last_error = "Timeout"
-            if attempt == max_retries - 1:
-                return url, f"✗ Timeout after {max_retries} tries", None
-                
-        except requests.exceptions.ConnectionError:
-            last_error = "Connection Error"
-            if attempt == max_retries - 1:
-                return url, f"✗ Connection Error after {max_retries} tries", None
-                
-        except requests.exceptions.RequestException as e:
-            last_error = f"Request Error: {str(e)[:30]}"
-            if attempt == max_retries - 1:
-                return url, f"✗ Error: {str(e)[:30]} after {max_retries} tries", None
-                
-        except Exception as e:
-            last_error = f"Unexpected Error: {str(e)[:30]}"
-            if attempt == max_retries - 1:
-                return url, f"✗ Unexpected Error: {str(e)[:30]} after {max_retries} tries", None
+            return urlparse(url).path.lower().endswith('.m3u8')
+        except ValueError:
+            return False
+
+    def steps(self, url):
+        """Generator yielding (url, max_bytes, headers, time_left) fetches
+
+        Each fetch is answered with (status_code, data, final_url, error) via
+        send(). Returns None if the stream looks playable, else an error label.
+        """
+        deadline = time.monotonic() + self.time_budget
+        bytes_left = self.byte_budget
+        playlist_url = url
+
+        # Master -> media playlist; one extra level tolerates a master pointing at a master
+        for depth in range(3):
+            with self.lock:
+                entry = self.playlists.get(playlist_url)
+                if entry:
+                    self.playlist_hits += 1
+            if entry is None:
+                time_left = deadline - time.monotonic()
+                if bytes_left <= 0 or time_left <= 0:
+                    return "HLS Budget Exceeded"
+                max_bytes = min(HLS_PLAYLIST_MAX_BYTES, bytes_left)
+                status_code, data, final_url, error = yield playlist_url, max_bytes, None, time_left
+                bytes_left -= len(data)
+                self._count_bytes(len(data))
+                if error:
+                    # Transient; not cached
+                    return f"HLS Playlist {error}"
+                kind, next_uri = parse_hls_playlist(data, truncated=len(data) >= max_bytes)
+                entry = (status_code, kind, urljoin(final_url, next_uri) if next_uri else None)
+                with self.lock:
+                    self.playlists[playlist_url] = entry
+
+            status_code, kind, next_url = entry
+            if not is_working_status_code(status_code):
+                return f"HLS Playlist ({status_code})"
+            if kind is None:
+                return "HLS Empty Playlist"
+            if kind == 'segment':
+                break
+            playlist_url = next_url
+        else:
+            return "HLS Playlist Loop"
+
+        time_left = deadline - time.monotonic()
+        if bytes_left <= 0 or time_left <= 0:
+            return "HLS Budget Exceeded"
+        max_bytes = min(HLS_SEGMENT_BYTES, bytes_left)
+        headers = {'Range': f"bytes=0-{max_bytes - 1}"}
+        status_code, data, final_url, error = yield next_url, max_bytes, headers, time_left
+        self._count_bytes(len(data))
+        if error:
+            return f"HLS Segment {error}"
+        if not is_working_status_code(status_code) or not data:
+            return f"HLS Segment ({status_code})"
+        return None
+
+    def validate(self, url, fetch):
+        """Run the deep check with a blocking fetch(url, max_bytes, headers, time_left)"""
+        steps = self.steps(url)
+        try:
+            request = next(steps)
+            while True:
+                request = steps.send(fetch(*request))
+        except StopIteration as finished:
+            return self._record(finished.value)
+
+    async def validate_async(self, url, fetch):
+        """Run the deep check with a coroutine fetch(url, max_bytes, headers, time_left)"""
+        steps = self.steps(url)
+        try:
+            request = next(steps)
+            while True:
+                request = steps.send(await fetch(*request))
+        except StopIteration as finished:
+            return self._record(finished.value)
+
+    def _count_bytes(self, count):
+        with self.lock:
+            self.bytes_fetched += count
+
+    def _record(self, error):
+        with self.lock:
+            self.validated += 1
+            if error:
+                self.failed += 1
+        return error
+
+def fetch_prefix(session, url, max_bytes, headers=None, timeout=10):
+    """GET at most max_bytes of a URL; returns (status_code, data, final_url, error)
+
+    timeout bounds the whole fetch, as aiohttp's total= does, not just each
+    socket read: a server trickling the body is cut off once it has passed.
+    """
+    deadline = time.monotonic() + timeout
+    try:
+        with session.get(url, headers=dict(PROBE_HEADERS, **(headers or {})), timeout=timeout, stream=True) as response:
+            data = b''
+            if is_working_status_code(response.status_code):
+                # read1 returns whatever one socket read brings, so the deadline is checked between trickles;
+                # urllib3 1.x lacks it, and there small read()s keep those checks from waiting on a full prefix
+                read1 = getattr(response.raw, 'read1', None)
+                while len(data) < max_bytes:
+                    if time.monotonic() >= deadline:
+                        return None, b'', url, "Timeout"
+                    if read1:
+                        chunk = read1(max_bytes - len(data), decode_content=True)
+                    else:
+                        chunk = response.raw.read(min(max_bytes - len(data), 8192), decode_content=True)
+                    if not chunk:
+                        break
+                    data += chunk
+            return response.status_code, data, response.url, None
+    except requests.exceptions.Timeout:
+        return None, b'', url, "Timeout"
+    except requests.exceptions.RequestException:
+        return None, b'', url, "Connection Error"
+
+async def async_fetch_prefix(session, url, max_bytes, headers=None, timeout=10):
+    """Async counterpart of fetch_prefix using a shared aiohttp session"""
+    try:
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            data = b''
+            if is_working_status_code(response.status):
+                while len(data) < max_bytes:
+                    chunk = await response.content.read(max_bytes - len(data))
+                    if not chunk:
+                        break
+                    data += chunk
+            return response.status, data, str(response.url), None
+    except asyncio.TimeoutError:
+        return None, b'', url, "Timeout"
+    except aiohttp.ClientError:
+        return None, b'', url, "Connection Error"
+
+async def http2_fetch_prefix(client, url, max_bytes, headers=None, timeout=10):
+    """Async counterpart of fetch_prefix on an httpx client"""
+    async def fetch():
+        async with client.stream('GET', url, headers=headers, timeout=timeout) as response:
+            data = b''
+            if is_working_status_code(response.status_code):
+                async for chunk in response.aiter_bytes():
+                    data += chunk
+                    if len(data) >= max_bytes:
+                        break
+            return response.status_code, data[:max_bytes], str(response.url), None
+
+    try:
+        # httpx's timeout is per read; wait_for bounds the whole fetch
+        return await asyncio.wait_for(fetch(), timeout)
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        return None, b'', url, "Timeout"
+    except httpx.HTTPError:
+        return None, b'', url, "Connection Error"
+
+def check_url(url, timeout=10, max_retries=3, session=None, cache=None):
+    """Check if a URL is accessible with retry logic, answering from the probe cache when fresh"""
+    if cache:
+        cached = cache.get(url, PROBE_HEADERS)
+        if cached:
+            status, status_code, error_class = cached
+            return url, status, status_code
+    
+    method = METHOD_LADDER[0]
+    for attempt in range(1, max_retries + 1):
+        started = time.monotonic()
+        status_code, error_class, error, retry_after = probe_url_once(url, timeout, session, method)
+        # Walk down the method ladder within the attempt when the method looks refused
+        while next_probe_method(method, status_code):
+            method = next_probe_method(method, status_code)
+            status_code, error_class, error, retry_after = probe_url_once(url, timeout, session, method)
+        latency = time.monotonic() - started
         
-        # Brief pause between retries (except for last attempt)
-        if attempt < max_retries - 1:
-            time.sleep(0.5)
+        policy_retries, policy_delay = RETRY_POLICY.get(error_class, (0, None))
+        if not error_class or attempt >= min(max_retries, 1 + policy_retries):
+            break
+        # Blocking pause; the engines schedule retries without holding a worker.
+        # A throttled answer waits as long as the server asked.
+        delay = retry_delay(attempt, policy_delay or 0.5)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, THROTTLE_MAX_WAIT))
+        time.sleep(delay)
     
-    # Fallback (should not reach here)
-    return url, f"✗ Failed after {max_retries} tries ({last_error})", None
+    status = format_probe_status(status_code, error, attempt)
+    if cache:
+        cache.put(url, PROBE_HEADERS, status, status_code, latency, error_class)
+    return url, status, status_code
 
 def group_entries_by_tvg_id(entries):
-    """Group entries by tvg-id, preserving order and metadata"""
+    """Group entries by tvg-id, preserving order (a group's metadata is its first entry's)"""
     tvg_groups = {}
     
     for entry in entries:
-        tvg_id = extract_tvg_id(entry['metadata'])
+        tvg_id = entry.tvg_id
         
         if tvg_id:
-            if tvg_id not in tvg_groups:
-                tvg_groups[tvg_id] = {
-                    'tvg_id': tvg_id,
-                    'metadata': entry['metadata'],  # Use first occurrence metadata
-                    'urls': [],
-                    'original_index': entry['original_index']
-                }
-            tvg_groups[tvg_id]['urls'].append({
-                'url': entry['url'],
-                'original_index': entry['original_index'],
-                'source_file': entry.get('source_file', 'unknown')
-            })
+            group = tvg_groups.get(tvg_id)
+            if group is None:
+                # Use first occurrence metadata
+                tvg_groups[tvg_id] = ChannelGroup(tvg_id, [entry], entry.original_index)
+            else:
+                group.urls.append(entry)
         else:
             # Handle entries without tvg-id as individual groups
-            unique_key = f"no_tvg_id_{entry['original_index']}"
-            tvg_groups[unique_key] = {
-                'tvg_id': None,
-                'metadata': entry['metadata'],
-                'urls': [{'url': entry['url'], 'original_index': entry['original_index'], 'source_file': entry.get('source_file', 'unknown')}],
-                'original_index': entry['original_index']
-            }
+            unique_key = f"no_tvg_id_{entry.original_index}"
+            tvg_groups[unique_key] = ChannelGroup(None, [entry], entry.original_index)
     
     return tvg_groups
 
-def check_urls_for_group(group_data, timeout=10, max_retries=3):
+def check_urls_for_group(group_data, timeout=10, max_retries=3, session_pool=None):
     """Check URLs for a tvg-id group and return first working URL"""
-    tvg_id = group_data['tvg_id']
-    urls = group_data['urls']
+    # Sequential single-group check; the engines schedule the same walk probe by probe
+    session = session_pool.session() if session_pool else None
     
     # Try URLs in original order
-    for url_data in urls:
-        url = url_data['url']
-        url_result, status, status_code = check_url(url, timeout, max_retries)
-        
+    for url_data in group_data.urls:
+        url = url_data.url
+        url_result, status, status_code = check_url(url, timeout, max_retries, session)
+
         if "Working" in status:
-            return {
-                'metadata': group_data['metadata'],
-                'url': url,
-                'tvg_id': tvg_id,
-                'original_index': group_data['original_index'],
-                'working_url_index': url_data['original_index'],
-                'total_urls_for_id': len(urls),
-                'status': status
-            }
-    
+            return build_group_result(group_data, url_data, status)
+
     # No working URLs found
     return None
 
+def build_group_result(group_data, url_data, status):
+    """Build the result entry for a group's working URL"""
+    # No metadata: workers build results too, and the source bytes stay with
+    # the parent, which attaches the entries to write when it records them
+    return {
+        'url': url_data.url,
+        'tvg_id': group_data.tvg_id,
+        'original_index': group_data.original_index,
+        'working_url_index': url_data.original_index,
+        'total_urls_for_id': len(group_data.urls),
+        'status': status
+    }
+
+# scheme://host[:port] followed by the path, query, fragment or nothing
+URL_HOST_RE = re.compile(r'[A-Za-z][A-Za-z0-9+.-]*://([A-Za-z0-9.-]+)(?::[0-9]*)?(?=[/?#]|$)')
+
+def get_url_host(url):
+    """Return the lowercase hostname of a URL ('' if it has none)"""
+    # Plain URLs, nearly all of them, skip the full urlparse
+    match = URL_HOST_RE.match(url)
+    if match:
+        return match.group(1).lower()
+    try:
+        return urlparse(url).hostname or ''
+    except ValueError:
+        return ''
+
+def get_url_origin(url):
+    """Return 'host:port' for a URL, filling in the scheme's default port ('' if it has no host)"""
+    try:
+        parsed = urlparse(url)
+        if not parsed.hostname:
+            return ''
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+    except ValueError:
+        return ''
+    return f"{parsed.hostname}:{port}"
+
+# getaddrinfo errors that mean the name has no address; anything else (a timeout,
+# EAI_AGAIN from an overloaded resolver) may pass, so the probe resolves it itself
+DNS_NEGATIVE_ERRORS = tuple(getattr(socket, name) for name in ('EAI_NONAME', 'EAI_NODATA') if hasattr(socket, name))
+# getaddrinfo flags that don't change which cached answer fits: aiohttp's threaded
+# resolver always asks with AI_ADDRCONFIG
+DNS_CACHE_FLAGS = socket.AI_ADDRCONFIG | getattr(socket, 'AI_V4MAPPED', 0)
+
+class DnsCache:
+    """Per-run resolver cache filled by a concurrent pre-pass, with negative entries
+
+    While installed it stands in for socket.getaddrinfo, so requests/urllib3,
+    aiohttp's threaded resolver and httpx (which passes the host as IDNA bytes)
+    answer pre-resolved hosts from memory. Lookups it can't answer exactly fall
+    through to the real resolver.
+    """
+
+    def __init__(self):
+        self.addresses = {}  # host -> getaddrinfo results, or None if it doesn't resolve
+        self.real_getaddrinfo = socket.getaddrinfo
+
+    def resolve_all(self, hosts, max_workers=32):
+        """Resolve hosts concurrently into the cache"""
+        hosts = [host for host in hosts if host and host not in self.addresses]
+        if not hosts:
+            return
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(hosts))) as executor:
+            for host, infos in zip(hosts, executor.map(self._lookup, hosts)):
+                if infos is not False:
+                    self.addresses[host] = infos
+
+    def _lookup(self, host):
+        try:
+            return self.real_getaddrinfo(host, None, socket.AF_UNSPEC, socket.SOCK_STREAM)
+        except socket.gaierror as exc:
+            if exc.errno in DNS_NEGATIVE_ERRORS:
+                return None
+            return False
+        except (UnicodeError, OSError):
+            # Not a DNS answer (e.g. an invalid IDNA name); leave it to the probe
+            return False
+
+    def unresolvable_count(self):
+        return sum(1 for infos in self.addresses.values() if infos is None)
+
+    def is_unresolvable(self, host):
+        """Return True if the pre-pass found no address for host"""
+        return host in self.addresses and self.addresses[host] is None
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        """socket.getaddrinfo replacement that answers from the cache"""
+        key = host
+        if isinstance(key, bytes):
+            try:
+                key = key.decode('idna')
+            except UnicodeError:
+                key = None
+        infos = self.addresses.get(key.lower(), False) if isinstance(key, str) else False
+        if infos is False or (type and type != socket.SOCK_STREAM) or proto or flags & ~DNS_CACHE_FLAGS:
+            return self.real_getaddrinfo(host, port, family, type, proto, flags)
+        if infos is None:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        if port is not None and not isinstance(port, int):
+            if not str(port).isdigit():
+                return self.real_getaddrinfo(host, port, family, type, proto, flags)
+            port = int(port)
+
+        matching = [(f, t, p, c, (addr[0], port or 0) + addr[2:]) for f, t, p, c, addr in infos if not family or f == family]
+        return matching or self.real_getaddrinfo(host, port, family, type, proto, flags)
+
+    def install(self):
+        socket.getaddrinfo = self.getaddrinfo
+
+    def uninstall(self):
+        socket.getaddrinfo = self.real_getaddrinfo
+
+def parse_host_limit_override(value):
+    """Parse a HOST=N per-host limit override for argparse"""
+    host, _, limit = value.partition('=')
+    if not host or not limit.isdigit():
+        raise argparse.ArgumentTypeError(f"expected HOST=N, got '{value}'")
+    return host.strip().lower(), int(limit)
+
+# Adaptive timeouts: a host's timeout is this multiple of its latency percentile
+ADAPTIVE_TIMEOUT_FACTOR = 3
+# Answers seen this run before a host's own percentile replaces the default or an earlier run's
+ADAPTIVE_MIN_SAMPLES = 5
+ADAPTIVE_WINDOW = 50
+
+class HostTimeouts:
+    """Per-host (connect, read) timeouts derived from the latencies each host has shown
+
+    Every answered probe adds its latency to a rolling window for its host; once
+    the window holds ADAPTIVE_MIN_SAMPLES answers, the host's timeout becomes
+    ADAPTIVE_TIMEOUT_FACTOR times the chosen percentile, kept within floor and
+    ceiling. A latency estimate from an earlier run (prior) applies until then,
+    and hosts without either keep the default timeout. The read timeout may
+    stretch to the ceiling for slow hosts; the connect timeout is the same
+    value capped at the default, since connect times aren't measured apart.
+    Each retry doubles the host's timeouts, up to those limits.
+    """
+
+    def __init__(self, default, floor=1.0, ceiling=30, percentile=95, prior=None):
+        self.default = default
+        self.floor = floor
+        self.ceiling = max(ceiling, floor)
+        self.percentile = percentile
+        self.samples = {}  # host -> recent answer latencies
+        self.estimates = dict(prior or {})  # host -> latency percentile in seconds
+        self.measured = set()  # Hosts whose estimate comes from this run
+
+    def record(self, host, latency):
+        """Add the latency of an answered probe for host"""
+        samples = self.samples.setdefault(host, deque(maxlen=ADAPTIVE_WINDOW))
+        samples.append(latency)
+        if len(samples) >= ADAPTIVE_MIN_SAMPLES:
+            ordered = sorted(samples)
+            rank = math.ceil(len(ordered) * self.percentile / 100)
+            self.estimates[host] = ordered[min(max(rank, 1), len(ordered)) - 1]
+            self.measured.add(host)
+
+    def for_host(self, host, attempt=1):
+        """Return (connect, read) timeouts for an attempt on host, or None for the default"""
+        estimate = self.estimates.get(host)
+        if estimate is None:
+            return None
+        read = min(self.ceiling, max(self.floor, estimate * ADAPTIVE_TIMEOUT_FACTOR * 2 ** (attempt - 1)))
+        return min(read, max(self.default, self.floor)), read
+
+    def measured_estimates(self):
+        """Return {host: latency percentile} for hosts measured this run"""
+        return {host: self.estimates[host] for host in self.measured}
+
+# Adaptive concurrency: the controller re-evaluates its limit about once per window
+CONCURRENCY_WINDOW = 1.0
+CONCURRENCY_MIN_SAMPLES = 5
+# Outcomes that may be caused by our own load (or local socket/fd exhaustion)
+CONCURRENCY_PRESSURE_CLASSES = ('timeout', 'connection', 'error')
+# Weight of a window's median when it is above the latency baseline: the
+# baseline drops to any new low at once but drifts back up, so one fast
+# window (a burst of quick 404s, say) doesn't hold it down for the run.
+# It never drifts right after a raise, when higher latency is the raise's doing
+CONCURRENCY_BASELINE_DECAY = 0.2
+
+class ConcurrencyController:
+    """AIMD limit on the number of probes in flight, replacing a fixed -w
+
+    Answers are collected in windows of CONCURRENCY_WINDOW seconds. After a
+    window where the limit was reached, throughput held up and the median
+    latency stayed within 25% of the baseline, the limit grows: it doubles while
+    throughput keeps rising with it (slow start, as in TCP), then grows by a
+    fixed step once throughput levels off or the limit has been cut.
+    When the share of timeouts and connection errors jumps above its running
+    average, or the median latency doubles, the limit is cut by 30%; in
+    between it holds. The baseline is a moving minimum of window medians (see
+    CONCURRENCY_BASELINE_DECAY). The limit at the end of each window is kept
+    in timeline, keyed by the second of the run.
+    """
+
+    def __init__(self, initial=20, minimum=4, maximum=200):
+        self.minimum = max(1, minimum)
+        self.maximum = max(maximum, self.minimum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.initial = self.limit
+        self.step = max(1, self.limit // 5)
+        self.slow_start = True
+        self.started = time.monotonic()
+        self.timeline = {}  # Second of the run -> limit
+        self.peak = self.limit
+        self.increases = 0
+        self.decreases = 0
+        self.base_latency = None  # Moving minimum of window medians
+        self.raised = False  # Whether the last window raised the limit
+        self.pressure_average = None
+        self.last_throughput = 0
+        self._reset_window(self.started)
+
+    def _reset_window(self, now):
+        self.window_started = now
+        self.completions = 0
+        self.pressure = 0
+        self.latencies = []
+        self.busiest = 0
+
+    def record(self, latency, error_class, running):
+        """Count one live probe answer; running is the number in flight when it finished"""
+        now = time.monotonic()
+        self.completions += 1
+        self.latencies.append(latency)
+        self.busiest = max(self.busiest, running)
+        if error_class in CONCURRENCY_PRESSURE_CLASSES:
+            self.pressure += 1
+
+        elapsed = now - self.window_started
+        if elapsed < CONCURRENCY_WINDOW or self.completions < CONCURRENCY_MIN_SAMPLES:
+            return
+
+        throughput = self.completions / elapsed
+        latency = sorted(self.latencies)[len(self.latencies) // 2]
+        pressure = self.pressure / self.completions
+        if self.base_latency is None or latency < self.base_latency:
+            self.base_latency = latency
+        base_latency = self.base_latency
+        if not self.raised:
+            self.base_latency += CONCURRENCY_BASELINE_DECAY * (latency - self.base_latency)
+        self.raised = False
+
+        pressure_spike = self.pressure_average is not None and pressure >= 0.2 and pressure > self.pressure_average + 0.1
+        latency_inflated = latency > max(2 * base_latency, base_latency + 0.1)
+        if pressure_spike or latency_inflated:
+            limit = max(self.minimum, int(self.limit * 0.7))
+            if limit < self.limit:
+                self.decreases += 1
+            self.limit = limit
+            self.slow_start = False
+        elif (self.busiest >= self.limit and throughput >= 0.9 * self.last_throughput and self.limit < self.maximum
+              and latency <= 1.25 * base_latency + 0.01):
+            if self.slow_start and throughput < 1.2 * self.last_throughput:
+                self.slow_start = False
+            self.limit = min(self.maximum, self.limit * 2 if self.slow_start else self.limit + self.step)
+            self.increases += 1
+            self.raised = True
+            self.peak = max(self.peak, self.limit)
+
+        self.pressure_average = pressure if self.pressure_average is None else 0.7 * self.pressure_average + 0.3 * pressure
+        self.last_throughput = throughput
+        self.timeline[int(now - self.started)] = self.limit
+        self._reset_window(now)
+
+class ProbeScheduler:
+    """Host-interleaved probe queue with per-host in-flight caps
+
+    Each group starts with its first URL and moves to the next backup when a
+    URL fails. Probes are queued per host and handed out round-robin across
+    hosts whose in-flight count is below their cap. Groups are taken from the
+    `groups` iterable in order, only when no queued probe can be dispatched.
+
+    Every dispatched probe is a single attempt. Failed attempts are parked on a
+    timer with exponential backoff and jitter instead of holding a worker. How
+    often and how long to wait depends on the error class (retry_policy), and
+    retries overall stay within retry_budget (a share of first attempts).
+
+    Probes start with the host's known-good method (HEAD unless learned
+    otherwise). An answer that looks like the method was refused moves the
+    probe down METHOD_LADDER right away, unless HEAD has already worked on the
+    host and the answer isn't an outright refusal (METHOD_REFUSED_STATUS_CODES).
+    The method that ends up working is remembered for the host, and kept in
+    the cache for later runs.
+
+    Probes are single-flight per probe_key: while one group's probe for a URL
+    is running, other groups wanting the same URL wait for it, and every later
+    occurrence reuses its final result.
+
+    Each origin (host:port) has a circuit breaker: after breaker_threshold consecutive
+    connection failures or timeouts it opens and the origin's remaining probes
+    fail fast; after breaker_cooldown seconds one trial probe is let through
+    (half-open), which either closes the circuit or opens it again.
+
+    With host_timeouts, each probe carries the (connect, read) timeouts for its
+    host in probe['timeout'] (None for the engine default), and every answer
+    feeds the host's latency window.
+
+    With a concurrency controller, engines keep concurrency_limit() probes in
+    flight instead of their fixed max_workers, and every live answer feeds it.
+
+    A 429 or 503 answer throttles its host instead of failing the URL: the
+    probe is parked (without using up an attempt) until Retry-After has passed,
+    and the host's probe rate is halved, at most once per round of paced
+    probes, by spacing out its probe starts. Every good answer from the host then gives
+    back THROTTLE_RATE_STEP probes per second until it runs unthrottled.
+
+    With a hedge delay, a backup is also started once the URL before it has
+    been pending that long. A group settles on its earliest-ordered working URL
+    as soon as every URL before it has failed; probes still running for a
+    settled group are ignored (or cancelled by the engine).
+    """
+
+    def __init__(self, groups, host_limit=10, host_limits=None, hedge_delay=0,
+                 max_retries=3, retry_backoff=0.5, retry_budget=0.25, cache=None, retry_policy=None, dns_cache=None,
+                 breaker_threshold=5, breaker_cooldown=30, deep=False, host_timeouts=None, concurrency=None):
+        self.host_limit = host_limit
+        self.host_limits = host_limits or {}
+        self.hedge_delay = hedge_delay
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.retry_budget = retry_budget
+        self.cache = cache
+        self.cache_headers = DEEP_CACHE_HEADERS if deep else PROBE_HEADERS
+        self.dns_cache = dns_cache
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.breakers = {}  # origin -> {'state': closed/open/half_open, 'failures', 'opened_at'}
+        self.host_timeouts = host_timeouts
+        self.early_timeouts = 0  # Timeouts cut off sooner than the default timeout
+        self.concurrency = concurrency
+        self.running = 0  # Probes handed out and not completed yet
+        self.throttles = {}  # host -> {'interval': gap between probe starts, 'next_allowed', 'last_cut'}
+        self.throttled_hosts = set()
+        self.throttled_probes = 0
+        self.throttle_cuts = 0
+        self.retry_policy = dict(RETRY_POLICY, **(retry_policy or {}))
+        self.resolved_limits = {}
+        self.queues = {}
+        self.in_flight = {}
+        self.ready = deque()  # Hosts with queued probes and spare capacity
+        self.ready_hosts = set()
+        self.timers = []  # Heap of (due_time, sequence, kind, probe) for hedges and retries, or
+                          # (due_time, sequence, 'host', host) when a throttled host may start a probe
+        self.timer_sequence = 0
+        self.pending_groups = 0
+        self.first_attempts = 0
+        self.retries = 0
+        self.retries_over_budget = 0
+        self.hedged_probes = 0
+        self.failure_classes = {}  # Final error class -> number of URLs
+        self.dns_fast_failures = 0
+        self.circuits_opened = 0
+        self.circuit_fast_failures = 0
+        self.host_methods = cache.get_host_methods() if cache else {}  # host -> method past the first rung
+        self.head_hosts = set()  # Hosts where HEAD has answered 2xx/3xx this run
+        self.method_fallbacks = 0
+        self.url_leaders = {}  # probe_key -> the probe answering for that URL
+        self.url_waiters = {}  # probe_key -> probes waiting on the leader
+        self.url_results = {}  # probe_key -> final outcome shared with later occurrences
+        self.probes_saved = 0
+        self.coalesced_probes = 0
+        # Groups are admitted lazily, when nothing queued can be dispatched, so probing
+        # starts right away and only the groups actually in play hold probe state
+        self.groups = iter(groups)
+        self.groups_exhausted = False
+
+    def limit_for(self, host):
+        """Return the in-flight cap for a host, honouring domain-suffix overrides"""
+        limit = self.resolved_limits.get(host)
+        if limit is None:
+            limit = self.host_limit
+            labels = host.split('.')
+            for i in range(len(labels)):
+                suffix = '.'.join(labels[i:])
+                if suffix in self.host_limits:
+                    limit = self.host_limits[suffix]
+                    break
+            # 0 means no cap for this host
+            limit = limit or float('inf')
+            self.resolved_limits[host] = limit
+        return limit
+
+    def done(self):
+        """Return True once every group has a final result"""
+        return self.groups_exhausted and self.pending_groups == 0
+
+    def concurrency_limit(self, max_workers):
+        """Return how many probes the engine should keep in flight"""
+        return self.concurrency.limit if self.concurrency else max_workers
+
+    def next_wakeup(self):
+        """Seconds until the next hedge or retry is due, or None if none are pending"""
+        if not self.timers:
+            return None
+        return max(0, self.timers[0][0] - time.monotonic())
+
+    def next_probe(self):
+        """Return the next probe to start, or None if every queued host is at its cap"""
+        self._release_due_timers()
+
+        while True:
+            if not self.ready:
+                # Everything queued is at its host cap (or nothing is queued): bring in another group
+                if not self._admit_group():
+                    return None
+                continue
+
+            host = self.ready.popleft()
+            self.ready_hosts.discard(host)
+            if not self._host_open(host):
+                # Throttled after it was marked ready; a 'host' timer brings it back
+                continue
+            probe = self.queues[host].popleft()
+
+            if probe['state']['finished']:
+                # Group settled while this probe was queued
+                self._settle_url(probe)
+                self._mark_ready(host)
+                continue
+
+            key = probe['url_key']
+            leader = self.url_leaders.get(key)
+            if leader is None and key not in self.url_results:
+                self.url_leaders[key] = probe
+            elif leader is not None and leader is not probe:
+                # Same URL already being probed for another group: wait for its answer
+                self.url_waiters.setdefault(key, []).append(probe)
+                self.coalesced_probes += 1
+                self._mark_ready(host)
+                continue
+
+            self.in_flight[host] = self.in_flight.get(host, 0) + 1
+            self.running += 1
+            probe['started'] = time.monotonic()
+            throttle = self.throttles.get(host)
+            if throttle:
+                # Space out starts on a throttled host
+                throttle['next_allowed'] = time.monotonic() + throttle['interval']
+                self._add_timer(throttle['interval'], 'host', host)
+            # Back of the rotation, so consecutive probes go to different hosts
+            self._mark_ready(host)
+
+            if probe['method'] is None:
+                probe['method'] = self.host_methods.get(host, METHOD_LADDER[0])
+            if self.host_timeouts:
+                probe['timeout'] = self.host_timeouts.for_host(host, probe['attempt'])
+            return probe
+
+    def immediate_outcome(self, probe):
+        """Return an outcome known without probing: unresolvable host, earlier result for the
+        same URL this run, fresh cache entry or open circuit
+
+        Otherwise the probe goes out; the first time it does, it counts towards
+        the retry budget and starts its hedge timer. Ladder steps, throttle
+        parks and single-flight waits come back through here but don't count or
+        consult the cache again.
+        """
+        if self.dns_cache and self.dns_cache.is_unresolvable(probe['host']):
+            self.dns_fast_failures += 1
+            return {'status_code': None, 'error_class': 'dns', 'error': "DNS Error", 'latency': 0, 'skipped': True}
+
+        shared = self.url_results.get(probe['url_key'])
+        if shared:
+            self.probes_saved += 1
+            return dict(shared)
+
+        # Once per probe: ladder steps and parks coming back would only add misses
+        if self.cache and not probe['cache_checked']:
+            probe['cache_checked'] = True
+            cached = self.cache.get(probe['url_data'].url, self.cache_headers)
+            if cached:
+                status, status_code, error_class = cached
+                return {'status': status, 'status_code': status_code, 'error_class': error_class}
+
+        if not self._circuit_allows(probe['origin']):
+            self.circuit_fast_failures += 1
+            return {'status_code': None, 'error_class': 'circuit_open', 'error': "Host Circuit Open", 'latency': 0, 'skipped': True}
+
+        if not probe['sent']:
+            probe['sent'] = True
+            self.first_attempts += 1
+            if self.hedge_delay and probe['position'] + 1 < len(probe['state']['group'].urls):
+                self._add_timer(self.hedge_delay, 'hedge', probe)
+        return None
+
+    def _circuit_allows(self, origin):
+        breaker = self.breakers.get(origin)
+        if not breaker or breaker['state'] == 'closed':
+            return True
+        if breaker['state'] == 'open' and time.monotonic() - breaker['opened_at'] >= self.breaker_cooldown:
+            # Half-open: this probe is the trial; the rest keep failing fast until it answers
+            breaker['state'] = 'half_open'
+            return True
+        return False
+
+    def _update_circuit(self, origin, error_class):
+        if not self.breaker_threshold:
+            return
+        breaker = self.breakers.setdefault(origin, {'state': 'closed', 'failures': 0, 'opened_at': 0})
+
+        if error_class == 'cancelled':
+            # Abandoned hedge says nothing about the host; let the next probe be the trial
+            if breaker['state'] == 'half_open':
+                breaker['state'] = 'open'
+        elif error_class in BREAKER_ERROR_CLASSES:
+            breaker['failures'] += 1
+            if breaker['state'] == 'half_open' or (breaker['state'] == 'closed' and breaker['failures'] >= self.breaker_threshold):
+                if breaker['state'] == 'closed':
+                    self.circuits_opened += 1
+                breaker['state'] = 'open'
+                breaker['opened_at'] = time.monotonic()
+        else:
+            # Any HTTP answer means the origin is up
+            breaker['state'] = 'closed'
+            breaker['failures'] = 0
+
+    def complete(self, probe, outcome):
+        """Record a probe attempt; returns (group_finished, group_result)
+
+        `outcome` holds status_code, error_class, error and latency for a live
+        attempt, or a final status and error_class for a cached one.
+        """
+        host = probe['host']
+        self.in_flight[host] -= 1
+        self.running -= 1
+        self._mark_ready(host)
+
+        # Only answers from the network move the origin's circuit breaker and latency window
+        if 'status' not in outcome and not outcome.get('skipped'):
+            self._update_circuit(probe['origin'], outcome['error_class'])
+            if self.host_timeouts:
+                if outcome['status_code'] is not None:
+                    self.host_timeouts.record(host, outcome['latency'])
+                elif outcome['error_class'] == 'timeout' and probe['timeout'] and probe['timeout'][1] < self.host_timeouts.default:
+                    self.early_timeouts += 1
+            if self.concurrency and outcome['error_class'] != 'cancelled':
+                self.concurrency.record(outcome['latency'], outcome['error_class'], self.running + 1)
+            if host in self.throttles and outcome['status_code'] is not None and outcome['status_code'] not in THROTTLE_STATUS_CODES:
+                self._relax_throttle(host)
+
+        state = probe['state']
+        if state['finished']:
+            # Late answer for a group that already settled; any waiters probe for themselves
+            self._settle_url(probe)
+            return False, None
+
+        status = outcome.get('status')
+        error_class = outcome['error_class']
+        if status is None:
+            status_code, error = outcome['status_code'], outcome['error']
+            if status_code in THROTTLE_STATUS_CODES and probe['parks'] < THROTTLE_MAX_PARKS:
+                # Not a failure: park the probe until the host takes probes again
+                probe['parks'] += 1
+                self.throttled_probes += 1
+                self._add_timer(self._throttle(host, outcome.get('retry_after'), probe['started']), 'retry', probe)
+                return False, None
+            method = probe['method']
+            next_method = next_probe_method(method, status_code, host in self.head_hosts)
+            if next_method:
+                # Not a retry: the same attempt goes straight back with the next method
+                probe['method'] = next_method
+                self.method_fallbacks += 1
+                self._queue_probe(probe, front=True)
+                return False, None
+            if is_working_status_code(status_code) and method == 'head':
+                self.head_hosts.add(host)
+            if is_working_status_code(status_code) and method != self.host_methods.get(host, METHOD_LADDER[0]):
+                self.host_methods[host] = method
+                if self.cache:
+                    self.cache.put_host_method(host, method)
+
+            policy_retries, policy_delay = self.retry_policy.get(error_class, (0, None))
+            if error_class and probe['attempt'] < min(self.max_retries, 1 + policy_retries):
+                if self.retries < max(10, self.retry_budget * self.first_attempts):
+                    self.retries += 1
+                    probe['attempt'] += 1
+                    self._add_timer(retry_delay(probe['attempt'] - 1, policy_delay or self.retry_backoff), 'retry', probe)
+                    return False, None
+                self.retries_over_budget += 1
+
+            status = format_probe_status(status_code, error, probe['attempt'])
+            # An open circuit says nothing about this URL next run, so it isn't cached
+            if self.cache and error_class != 'circuit_open':
+                self.cache.put(probe['url_data'].url, self.cache_headers, status, status_code, outcome['latency'], error_class)
+
+        if error_class != 'circuit_open':
+            self._settle_url(probe, {'status': status, 'status_code': outcome['status_code'], 'error_class': error_class})
+        else:
+            self._settle_url(probe)
+
+        if error_class:
+            self.failure_classes[error_class] = self.failure_classes.get(error_class, 0) + 1
+
+        working = "Working" in status
+        state['outcomes'][probe['position']] = (working, status)
+        if not working:
+            self._enqueue_next(state)
+
+        # Settle on the earliest working URL once everything before it has failed
+        for position in range(state['next_position']):
+            outcome = state['outcomes'].get(position)
+            if outcome is None:
+                return False, None
+            if outcome[0]:
+                return True, self._finish(state, position, outcome[1])
+
+        if state['next_position'] < len(state['group'].urls):
+            return False, None
+
+        # No working URLs found
+        return True, self._finish(state)
+
+    def _host_open(self, host):
+        throttle = self.throttles.get(host)
+        return not throttle or time.monotonic() >= throttle['next_allowed']
+
+    def _throttle(self, host, retry_after, started):
+        # Cut the host's rate once per burst and hold it off for Retry-After; returns the park delay.
+        # started is when the throttled probe was dispatched
+        now = time.monotonic()
+        throttle = self.throttles.get(host)
+        if throttle is None:
+            throttle = self.throttles[host] = {'interval': 0, 'next_allowed': now, 'last_cut': None}
+            self.throttled_hosts.add(host)
+        # At most one cut per round of paced probes, as TCP cuts at most once per round trip:
+        # answers to probes started before the last cut say nothing about the new rate
+        burst_window = max(THROTTLE_BURST_WINDOW, throttle['interval'] * THROTTLE_BURST_INTERVALS)
+        if throttle['last_cut'] is None or (started >= throttle['last_cut'] and now - throttle['last_cut'] >= burst_window):
+            # Halving the rate doubles the gap between probe starts
+            throttle['interval'] = min(THROTTLE_MAX_INTERVAL, max(THROTTLE_MIN_INTERVAL, throttle['interval'] * 2))
+            throttle['last_cut'] = now
+            self.throttle_cuts += 1
+            cut = True
+        else:
+            cut = False
+        wait = throttle['interval'] if retry_after is None else min(retry_after, THROTTLE_MAX_WAIT)
+        if cut and now + wait > throttle['next_allowed']:
+            # Only the cut holds the whole host off; later answers in the burst park just their probe
+            throttle['next_allowed'] = now + wait
+            self._add_timer(wait, 'host', host)
+        return wait
+
+    def _relax_throttle(self, host):
+        # Additive increase: each good answer gives back THROTTLE_RATE_STEP probes/second
+        throttle = self.throttles[host]
+        throttle['interval'] = 1 / (1 / throttle['interval'] + THROTTLE_RATE_STEP)
+        if throttle['interval'] < THROTTLE_MIN_INTERVAL / 2 and time.monotonic() >= throttle['next_allowed']:
+            del self.throttles[host]
+
+    def _settle_url(self, probe, result=None):
+        # Called when a probe is done with its URL; if it was the URL's leader, share
+        # its final result (if any) and send the waiters back to their host queues
+        key = probe['url_key']
+        if self.url_leaders.get(key) is not probe:
+            return
+        del self.url_leaders[key]
+        if result:
+            self.url_results[key] = result
+        for waiter in self.url_waiters.pop(key, ()):
+            self._queue_probe(waiter, front=True)
+
+    def _admit_group(self):
+        # Start the next group's first URL; False once every group has started
+        group_data = next(self.groups, None)
+        if group_data is None:
+            self.groups_exhausted = True
+            return False
+        state = {'group': group_data, 'next_position': 0, 'outcomes': {}, 'probes': [], 'finished': False}
+        self.pending_groups += 1
+        self._enqueue_next(state)
+        return True
+
+    def _finish(self, state, position=None, status=None):
+        state['finished'] = True
+        self.pending_groups -= 1
+        if position is None:
+            return None
+        group_data = state['group']
+        return build_group_result(group_data, group_data.urls[position], status)
+
+    def _add_timer(self, delay, kind, probe):
+        self.timer_sequence += 1
+        heapq.heappush(self.timers, (time.monotonic() + delay, self.timer_sequence, kind, probe))
+
+    def _release_due_timers(self):
+        now = time.monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            kind, probe = heapq.heappop(self.timers)[2:]
+            if kind == 'host':
+                # A throttled host may start its next probe; probe is the host name here
+                self._mark_ready(probe)
+                continue
+            state = probe['state']
+            if state['finished']:
+                if kind == 'retry':
+                    self._settle_url(probe)
+                continue
+
+            if kind == 'retry':
+                # Retries go to the front of their host queue, like backups
+                self._queue_probe(probe)
+            elif probe['position'] not in state['outcomes'] and state['next_position'] == probe['position'] + 1:
+                # Hedge: the probe is still pending and the group hasn't moved on by itself
+                self.hedged_probes += 1
+                self._enqueue_next(state)
+
+    def _enqueue_next(self, state):
+        position = state['next_position']
+        if position >= len(state['group'].urls):
+            return
+        state['next_position'] += 1
+
+        url_data = state['group'].urls[position]
+        probe = {'state': state, 'url_data': url_data, 'position': position, 'attempt': 1, 'parks': 0, 'method': None, 'timeout': None, 'started': None, 'sent': False,
+                 'cache_checked': False, 'host': url_data.host, 'origin': get_url_origin(url_data.url),
+                 'url_key': probe_key(url_data.url, self.cache_headers)}
+        state['probes'].append(probe)
+        self._queue_probe(probe)
+
+    def _queue_probe(self, probe, front=False):
+        host = probe['host']
+        host_queue = self.queues.setdefault(host, deque())
+        # Backups and retries jump the host queue so started groups finish before new ones begin
+        if front or probe['position'] or probe['attempt'] > 1:
+            host_queue.appendleft(probe)
+        else:
+            host_queue.append(probe)
+        self._mark_ready(host)
+
+    def _mark_ready(self, host):
+        if (host not in self.ready_hosts and self.queues.get(host) and self.in_flight.get(host, 0) < self.limit_for(host)
+                and self._host_open(host)):
+            self.ready.append(host)
+            self.ready_hosts.add(host)
+
+def run_probe_attempt(url, timeout, session_pool, method='head', hls_validator=None, probe_timeout=None):
+    """Run one probe attempt on the calling worker's pooled session
+
+    probe_timeout, a (connect, read) tuple, replaces timeout for the probe itself.
+    The latency reported is the probe's alone, without the deep HLS check.
+    """
+    started = time.monotonic()
+    session = session_pool.session()
+    status_code, error_class, error, retry_after = probe_url_once(url, probe_timeout or timeout, session, method)
+    latency = time.monotonic() - started
+    if hls_validator and is_working_status_code(status_code) and hls_validator.applies_to(url):
+        hls_error = hls_validator.validate(url, lambda url, max_bytes, headers, time_left:
+                                           fetch_prefix(session, url, max_bytes, headers, min(timeout, time_left)))
+        if hls_error:
+            status_code, error_class, error = None, 'hls', hls_error
+    return {'status_code': status_code, 'error_class': error_class, 'error': error, 'retry_after': retry_after,
+            'latency': latency}
+
+def run_thread_engine(scheduler, on_result, timeout=10, max_workers=20, hls_validator=None):
+    """Run scheduled probes on a thread pool, reporting each group as it finishes"""
+    session_pool = ProbeSessionPool(max_workers)
+    completed = queue.Queue()
+    in_flight = {}
+
+    def finish_probe(probe, outcome):
+        finished, result = scheduler.complete(probe, outcome)
+        if finished:
+            # Threads can't be interrupted; probes still running for this group are ignored
+            on_result(probe['state']['group'], result)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while in_flight or not scheduler.done():
+            while len(in_flight) < scheduler.concurrency_limit(max_workers):
+                probe = scheduler.next_probe()
+                if probe is None:
+                    break
+                immediate = scheduler.immediate_outcome(probe)
+                if immediate:
+                    finish_probe(probe, immediate)
+                    continue
+                future = executor.submit(run_probe_attempt, probe['url_data'].url, timeout, session_pool, probe['method'],
+                                         hls_validator, probe['timeout'])
+                in_flight[future] = probe
+                future.add_done_callback(completed.put)
+
+            if not in_flight:
+                # Only parked retries are left
+                time.sleep(scheduler.next_wakeup() or 0)
+                continue
+
+            try:
+                # Wake up for due hedges and retries even if nothing has finished
+                future = completed.get(timeout=scheduler.next_wakeup())
+            except queue.Empty:
+                continue
+
+            finish_probe(in_flight.pop(future), future.result())
+
+    return session_pool.close()
+
+async def _dispatch_probe_tasks(scheduler, on_result, max_workers, probe_url, hls_validator=None, fetch=None):
+    """Run scheduled probes as tasks on the running loop, keeping at most max_workers in flight
+
+    probe_url is a coroutine function taking a URL, a probe method and the probe's
+    (connect, read) timeout or None, and returning (status_code, error_class, error, retry_after).
+    With an hls_validator, working playlists are deep-checked through
+    fetch(url, max_bytes, headers, time_left). A scheduler with a concurrency
+    controller sets the in-flight limit instead of max_workers.
+    """
+    completed = asyncio.Queue()
+    tasks = set()  # Strong references so running probes aren't garbage collected
+    in_flight = 0
+    getter = None
+
+    async def run_probe(probe):
+        started = time.monotonic()
+        latency = None
+        try:
+            url = probe['url_data'].url
+            status_code, error_class, error, retry_after = await probe_url(url, probe['method'], probe['timeout'])
+            # Taken before the deep check, which would skew the timeout and concurrency estimates
+            latency = time.monotonic() - started
+            if hls_validator and is_working_status_code(status_code) and hls_validator.applies_to(url):
+                hls_error = await hls_validator.validate_async(url, fetch)
+                if hls_error:
+                    status_code, error_class, error = None, 'hls', hls_error
+        except asyncio.CancelledError:
+            # Hedged probe whose group already settled; still report it to free its slot
+            status_code, error_class, error, retry_after = None, 'cancelled', "Cancelled", None
+        if latency is None:
+            latency = time.monotonic() - started
+        outcome = {'status_code': status_code, 'error_class': error_class, 'error': error, 'retry_after': retry_after,
+                   'latency': latency}
+        completed.put_nowait((probe, outcome))
+
+    def finish_probe(probe, outcome):
+        finished, result = scheduler.complete(probe, outcome)
+        if finished:
+            for sibling in probe['state']['probes']:
+                if 'task' in sibling and not sibling['task'].done():
+                    sibling['task'].cancel()
+            on_result(probe['state']['group'], result)
+
+    while in_flight or not scheduler.done():
+        while in_flight < scheduler.concurrency_limit(max_workers):
+            probe = scheduler.next_probe()
+            if probe is None:
+                break
+            immediate = scheduler.immediate_outcome(probe)
+            if immediate:
+                finish_probe(probe, immediate)
+                continue
+            task = asyncio.ensure_future(run_probe(probe))
+            probe['task'] = task
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            in_flight += 1
+
+        if not in_flight:
+            # Only parked retries are left (or the last group just finished)
+            await asyncio.sleep(scheduler.next_wakeup() or 0)
+            continue
+
+        # Wake up for due hedges and retries even if nothing has finished. The getter
+        # survives timeouts, since cancelling a Queue.get can drop an item.
+        if getter is None:
+            getter = asyncio.ensure_future(completed.get())
+        done, pending = await asyncio.wait({getter}, timeout=scheduler.next_wakeup())
+        if not done:
+            continue
+
+        probe, outcome = getter.result()
+        getter = None
+        in_flight -= 1
+        finish_probe(probe, outcome)
+
+    if getter:
+        getter.cancel()
+
+async def _async_run_scheduler(scheduler, on_result, timeout, max_workers, hls_validator=None):
+    """Dispatch scheduled probes through a shared aiohttp session"""
+    # sock_connect/sock_read mirror the per-phase timeout used by requests
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    # ThreadedResolver goes through socket.getaddrinfo, so it sees the DNS pre-pass cache
+    connector = aiohttp.TCPConnector(limit=max_workers, ttl_dns_cache=300, resolver=aiohttp.ThreadedResolver())
+    stats = {'connections_opened': 0, 'connections_reused': 0}
+
+    # Count keep-alive reuse the same way the thread engine does
+    async def on_connection_create(session, context, params):
+        stats['connections_opened'] += 1
+
+    async def on_connection_reuse(session, context, params):
+        stats['connections_reused'] += 1
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(on_connection_create)
+    trace_config.on_connection_reuseconn.append(on_connection_reuse)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout, headers=PROBE_HEADERS, trace_configs=[trace_config]) as session:
+        await _dispatch_probe_tasks(scheduler, on_result, max_workers,
+                                    lambda url, method, probe_timeout: async_probe_url_once(session, url, method, probe_timeout),
+                                    hls_validator, lambda url, max_bytes, headers, time_left:
+                                    async_fetch_prefix(session, url, max_bytes, headers, min(timeout, time_left)))
+
+    return stats
+
+async def _http2_run_scheduler(scheduler, on_result, timeout, max_workers, hls_validator=None):
+    """Dispatch scheduled probes through one httpx client that multiplexes each origin over HTTP/2"""
+    # Probes to an h2 origin share a connection as concurrent streams; origins whose
+    # ALPN doesn't offer h2 (and plain http://) get pooled HTTP/1.1 connections instead
+    limits = httpx.Limits(max_connections=max_workers, max_keepalive_connections=max_workers)
+    # No pool timeout: at most max_workers probes wait for a connection at once
+    client_timeout = httpx.Timeout(timeout, pool=None)
+    stats = {'connections_opened': 0, 'connections_reused': 0, 'http2_requests': 0}
+    requests_sent = 0
+
+    async def trace(event, info):
+        nonlocal requests_sent
+        if event == 'connection.connect_tcp.complete':
+            stats['connections_opened'] += 1
+        elif event in ('http11.send_request_headers.complete', 'http2.send_request_headers.complete'):
+            requests_sent += 1
+            if event.startswith('http2.'):
+                stats['http2_requests'] += 1
+
+    async with httpx.AsyncClient(http2=True, limits=limits, timeout=client_timeout, headers=PROBE_HEADERS,
+                                 follow_redirects=True) as client:
+        await _dispatch_probe_tasks(scheduler, on_result, max_workers,
+                                    lambda url, method, probe_timeout: http2_probe_url_once(client, url, trace, method, probe_timeout),
+                                    hls_validator, lambda url, max_bytes, headers, time_left:
+                                    http2_fetch_prefix(client, url, max_bytes, headers, min(timeout, time_left)))
+
+    stats['connections_reused'] = max(0, requests_sent - stats['connections_opened'])
+    return stats
+
+def run_async_engine(scheduler, on_result, timeout=10, max_workers=20, hls_validator=None):
+    """Run scheduled probes on an asyncio event loop, reporting each group as it finishes"""
+    return asyncio.run(_async_run_scheduler(scheduler, on_result, timeout, max_workers, hls_validator))
+
+def run_http2_engine(scheduler, on_result, timeout=10, max_workers=20, hls_validator=None):
+    """Run scheduled probes on an asyncio event loop over multiplexed HTTP/2 connections"""
+    return asyncio.run(_http2_run_scheduler(scheduler, on_result, timeout, max_workers, hls_validator))
+
+ENGINES = {
+    'thread': run_thread_engine,
+    'async': run_async_engine,
+    'http2': run_http2_engine,
+}
+
+def write_m3u_entry(f, entry):
+    """Write one entry's metadata lines and URL to a binary file
+
+    The lines are copied byte for byte from the source playlist; only a
+    rewritten group-title value is encoded anew.
+    """
+    # Write metadata lines
+    f.write(entry['metadata_entry'].raw_metadata(entry.get('source_prefix')))
+    # Write URL
+    f.write(entry['url_entry'].raw_url())
+
 def write_filtered_m3u(working_entries, output_file):
     """Write working entries to a new M3U file"""
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write("#EXTM3U\n")
+    with open(output_file, 'wb') as f:
+        f.write(b"#EXTM3U\n")
         for entry in working_entries:
-            # Write metadata lines
-            for metadata_line in entry['metadata']:
-                f.write(metadata_line + "\n")
-            # Write URL
-            f.write(entry['url'] + "\n")
-
-def collect_all_entries(input_files):
-    """Collect all entries from multiple files with global indexing"""
+            write_m3u_entry(f, entry)
+
+class OrderedPlaylistWriter:
+    """Streams results to the output in original order as they settle
+
+    Groups finish in completion order; a reorder buffer keyed by original_index
+    holds each result until every group before it is done, then it is written
+    out. Output goes to a temp file next to the target, which replaces the
+    target on close(), so a partial run never clobbers the last good playlist.
+    """
+
+    def __init__(self, output_file, order):
+        self.output_file = output_file
+        self.temp_file = f"{output_file}.tmp"
+        self.expected = deque(order)  # original_index of every group, ascending
+        self.buffer = {}
+        self.max_buffered = 0
+        self.first_write = None
+        self.started = time.monotonic()
+        self.file = open(self.temp_file, 'wb')
+        self.file.write(b"#EXTM3U\n")
+
+    def add(self, original_index, entry):
+        """Record a group's working entry (None if it has none) and write what became final"""
+        self.buffer[original_index] = entry
+        self.max_buffered = max(self.max_buffered, len(self.buffer))
+
+        wrote = False
+        while self.expected and self.expected[0] in self.buffer:
+            entry = self.buffer.pop(self.expected.popleft())
+            if entry:
+                write_m3u_entry(self.file, entry)
+                wrote = True
+        if wrote:
+            self.file.flush()
+            if self.first_write is None:
+                self.first_write = time.monotonic() - self.started
+
+    def close(self):
+        """Write the rest and move the finished playlist into place"""
+        while self.expected:
+            entry = self.buffer.pop(self.expected.popleft(), None)
+            if entry:
+                write_m3u_entry(self.file, entry)
+        self.file.close()
+        os.replace(self.temp_file, self.output_file)
+
+    def abort(self):
+        """Drop the temp file, leaving any previous output untouched"""
+        self.file.close()
+        os.remove(self.temp_file)
+
+def collect_all_entries(input_files, processes=1):
+    """Collect all entries from multiple files with global indexing
+
+    With processes > 1 and enough input to be worth it, files (and chunks of
+    large files, see split_m3u_chunks) are parsed in a process pool. The
+    pieces are put back together in file and chunk order, so entries are
+    numbered exactly as in a single pass.
+    """
+    sources = [M3USource(file_path) for file_path in input_files]
+    parallel = processes > 1 and sum(os.path.getsize(file_path) for file_path in input_files) >= PARSE_PARALLEL_MIN_BYTES
+    if parallel:
+        tasks = [(index, start, end) for index, source in enumerate(sources)
+                 for start, end in split_m3u_chunks(source.data)]
+    else:
+        tasks = [(index, 0, None) for index in range(len(sources))]
+    
     all_entries = []
-    global_index = 0
+    tvg_ids = {}
     
-    for file_path in input_files:
-        entries = parse_m3u_with_metadata(file_path)
-        
-        for entry in entries:
-            entry['original_index'] = global_index
-            entry['source_file'] = os.path.basename(file_path)
-            all_entries.append(entry)
-            global_index += 1
+    def add_entries(index, columns):
+        # One string per source file, host and tvg-id, shared by all their entries
+        source_file = sys.intern(os.path.basename(input_files[index]))
+        all_entries.extend(build_playlist_entries(sources[index], columns, source_file, len(all_entries), tvg_ids))
+    
+    if parallel:
+        # spawn: the children only parse, they need nothing from this process.
+        # map() yields in task order, so entries are built while later chunks parse
+        with ProcessPoolExecutor(min(processes, len(tasks)), mp_context=multiprocessing.get_context('spawn')) as pool:
+            parsed = pool.map(parse_m3u_span, [input_files[index] for index, _, _ in tasks],
+                              [start for _, start, _ in tasks], [end for _, _, end in tasks])
+            for (index, _, _), columns in zip(tasks, parsed):
+                add_entries(index, columns)
+    else:
+        for index, start, end in tasks:
+            add_entries(index, parse_m3u_span(input_files[index], start, end))
     
     return all_entries
 
-def process_all_files(input_files, timeout=10, max_retries=3, max_workers=20, quiet=False):
-    """Process multiple M3U files with cross-file tvg-id grouping"""
+def benchmark_parse_memory(input_files, processes=1):
+    """Parse and group input_files under tracemalloc; returns counts, memory and time
+
+    Memory used by parse processes (processes > 1) is not traced.
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        entries = collect_all_entries(input_files, processes)
+        tvg_groups = group_entries_by_tvg_id(entries)
+        seconds = time.perf_counter() - started
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'entries': len(entries), 'groups': len(tvg_groups), 'current_bytes': current, 'peak_bytes': peak, 'seconds': seconds}
+
+# Parse snapshots start with the magic and a length-prefixed JSON header;
+# bump the version whenever parsing changes, which makes old ones misses
+SNAPSHOT_MAGIC = b'M3USNAP\n'
+SNAPSHOT_VERSION = 4
+
+def hash_input_files(input_files):
+    """Return [file name, SHA-256 of its content] for each input file, in order"""
+    return [[os.path.basename(file_path), hashlib.sha256(M3USource(file_path).data).hexdigest()]
+            for file_path in input_files]
+
+def pack_snapshot_column(values):
+    """Encode repeating strings (None allowed) as (newline-joined table, little-endian index array)
+
+    Index 0 stands for None, index n for the table's nth string.
+    """
+    table = {}
+    indexes = array('I', [0 if value is None else table.setdefault(value, len(table) + 1) for value in values])
+    if sys.byteorder == 'big':
+        indexes.byteswap()
+    return '\n'.join(table).encode('utf-8'), indexes.tobytes()
+
+def unpack_snapshot_column(table, indexes):
+    """Decode pack_snapshot_column's output back into the list of strings"""
+    # An empty table still splits into [''], which is harmless when unused and right when it isn't
+    values = [None] + [sys.intern(value) for value in table.decode('utf-8').split('\n')]
+    column = array('I')
+    column.frombytes(indexes)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return [values[index] for index in column]
+
+def save_parse_snapshot(snapshot_file, input_files, entries, file_hashes):
+    """Atomically write parsed entries as a snapshot for inputs with these hashes
+
+    After the header come the zlib-compressed columns: entry offsets as
+    little-endian 64-bit integers, the newline-joined URLs (no field can
+    hold a newline), then tvg-ids and hosts, which repeat, as a table of
+    distinct values plus an index per entry.
+    """
+    counts = {file_path: 0 for file_path in input_files}
+    for entry in entries:
+        counts[entry.source.path] += 1
+    offsets = array('Q', [entry.offset for entry in entries])
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    sections = [offsets.tobytes(), '\n'.join(entry.url for entry in entries).encode('utf-8')]
+    sections += pack_snapshot_column([entry.tvg_id for entry in entries])
+    sections += pack_snapshot_column([entry.host for entry in entries])
+    header = json.dumps({
+        'version': SNAPSHOT_VERSION,
+        'files': file_hashes,
+        'counts': [counts[file_path] for file_path in input_files],
+        'sections': [len(section) for section in sections],
+    }).encode('utf-8')
+    
+    temp_file = f"{snapshot_file}.tmp"
+    with open(temp_file, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        f.write(zlib.compress(b''.join(sections), 1))
+    os.replace(temp_file, snapshot_file)
+
+def load_parse_snapshot(snapshot_file, input_files, file_hashes):
+    """Return the entries saved for inputs with these hashes, or None if the snapshot is missing, stale or unreadable"""
+    try:
+        with open(snapshot_file, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                return None
+            header_size, = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_size))
+            if header['version'] != SNAPSHOT_VERSION or header['files'] != file_hashes:
+                return None
+            body = zlib.decompress(f.read())
+    except (OSError, ValueError, KeyError, struct.error, zlib.error):
+        return None
+    
+    sections = []
+    position = 0
+    for size in header['sections']:
+        sections.append(body[position:position + size])
+        position += size
+    offsets = array('Q')
+    offsets.frombytes(sections[0])
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    urls = sections[1].decode('utf-8').split('\n') if offsets else []
+    tvg_ids = unpack_snapshot_column(sections[2], sections[3])
+    hosts = unpack_snapshot_column(sections[4], sections[5])
+    
+    all_entries = []
+    for file_path, count in zip(input_files, header['counts']):
+        start = len(all_entries)
+        columns = [column[start:start + count] for column in (offsets, urls, tvg_ids, hosts)]
+        all_entries += build_playlist_entries(M3USource(file_path), columns, sys.intern(os.path.basename(file_path)), start)
+    return all_entries
+
+def collect_all_entries_cached(input_files, snapshot_file, processes=1):
+    """collect_all_entries through a parse snapshot; returns (entries, True if they came from the snapshot)
+
+    The snapshot is keyed by the content hash of every input file, so any
+    change to them (or to the file list) parses afresh and replaces it.
+    """
+    file_hashes = hash_input_files(input_files)
+    entries = load_parse_snapshot(snapshot_file, input_files, file_hashes)
+    if entries is not None:
+        return entries, True
+    entries = collect_all_entries(input_files, processes)
+    try:
+        save_parse_snapshot(snapshot_file, input_files, entries, file_hashes)
+    except OSError as e:
+        print(f"Warning: could not save parse snapshot {snapshot_file}: {e}")
+    return entries, False
+
+def group_manifest_key(group_data):
+    """Stable key for a group across runs (no-tvg-id groups are keyed by URL)"""
+    return group_data.tvg_id or f"url:{group_data.urls[0].url}"
+
+def load_manifest(manifest_file):
+    """Load the previous run's manifest, or an empty one if missing or unreadable"""
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest, manifest_file):
+    """Atomically write the manifest for the next incremental run"""
+    temp_file = f"{manifest_file}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temp_file, manifest_file)
+
+def split_incremental_groups(tvg_groups, manifest, refresh_fraction=0.1):
+    """Split groups into ones to probe and ones whose previous result still applies
+
+    A group is unchanged when the previous manifest has the same key with the same
+    URLs in the same order. The oldest-checked refresh_fraction of unchanged groups
+    are probed again anyway, so every result is re-verified over a few runs.
+    """
+    to_probe = []
+    unchanged = []
+
+    for group_data in tvg_groups.values():
+        previous = manifest.get(group_manifest_key(group_data))
+        if previous and previous['urls'] == [url_data.url for url_data in group_data.urls]:
+            unchanged.append((previous['checked_at'], group_data, previous))
+        else:
+            to_probe.append(group_data)
+
+    unchanged.sort(key=lambda item: item[0])
+    refresh_count = math.ceil(len(unchanged) * refresh_fraction)
+    refreshed = [group_data for checked_at, group_data, previous in unchanged[:refresh_count]]
+    reused = [(group_data, previous) for checked_at, group_data, previous in unchanged[refresh_count:]]
+
+    to_probe.extend(refreshed)
+    to_probe.sort(key=lambda group_data: group_data.original_index)
+    return to_probe, reused, len(refreshed)
+
+def run_probe_phase(groups, on_result, options, cache=None, dns_cache=None, hls_validator=None):
+    """Probe groups in this process with the configured engine; returns the probe counters"""
+    host_timeouts = None
+    if options.get('adaptive_timeouts'):
+        floor, ceiling, percentile = options['adaptive_timeouts']
+        host_timeouts = HostTimeouts(options['timeout'], floor, ceiling, percentile,
+                                     prior=cache.get_host_latencies() if cache else None)
+    concurrency = None
+    max_workers = options['max_workers']
+    if options.get('adaptive_concurrency'):
+        concurrency = ConcurrencyController(max_workers, *options['adaptive_concurrency'])
+        # Pools and connectors are sized for the most the controller may allow
+        max_workers = concurrency.maximum
+    scheduler = ProbeScheduler(groups, options['host_limit'], options['host_limits'], options['hedge_delay'],
+                               options['max_retries'], options['retry_backoff'], options['retry_budget'], cache,
+                               options['retry_policy'], dns_cache, options['breaker_threshold'], options['breaker_cooldown'],
+                               deep=hls_validator is not None, host_timeouts=host_timeouts, concurrency=concurrency)
+    if dns_cache:
+        dns_cache.install()
+    try:
+        engine_stats = ENGINES[options['engine']](scheduler, on_result, options['timeout'], max_workers, hls_validator)
+    finally:
+        if dns_cache:
+            dns_cache.uninstall()
+
+    stats = dict(engine_stats,
+                 retries=scheduler.retries, retries_over_budget=scheduler.retries_over_budget,
+                 method_fallbacks=scheduler.method_fallbacks, get_hosts=set(scheduler.host_methods),
+                 dns_fast_failures=scheduler.dns_fast_failures, circuits_opened=scheduler.circuits_opened,
+                 circuit_fast_failures=scheduler.circuit_fast_failures, probes_saved=scheduler.probes_saved,
+                 coalesced_probes=scheduler.coalesced_probes, hedged_probes=scheduler.hedged_probes,
+                 throttled_probes=scheduler.throttled_probes, throttle_cuts=scheduler.throttle_cuts,
+                 throttled_hosts=scheduler.throttled_hosts,
+                 failure_classes=scheduler.failure_classes)
+    if cache:
+        stats.update(cache_hits=cache.hits, cache_misses=cache.misses)
+    if host_timeouts:
+        stats.update(adaptive_hosts=set(host_timeouts.estimates), early_timeouts=scheduler.early_timeouts)
+        if cache:
+            cache.put_host_latencies(host_timeouts.measured_estimates())
+    if concurrency:
+        stats.update(concurrency_timeline=concurrency.timeline, concurrency_initial=concurrency.initial,
+                     concurrency_peak=concurrency.peak, concurrency_final=concurrency.limit,
+                     concurrency_increases=concurrency.increases, concurrency_decreases=concurrency.decreases)
+    if hls_validator:
+        stats.update(hls_validated=hls_validator.validated, hls_failed=hls_validator.failed,
+                     hls_playlist_hits=hls_validator.playlist_hits, hls_bytes=hls_validator.bytes_fetched)
+    return stats
+
+def empty_probe_stats():
+    """The counters run_probe_phase always returns, at zero; shard totals start from these"""
+    return {'connections_opened': 0, 'connections_reused': 0, 'retries': 0, 'retries_over_budget': 0,
+            'method_fallbacks': 0, 'get_hosts': set(), 'dns_fast_failures': 0, 'circuits_opened': 0,
+            'circuit_fast_failures': 0, 'probes_saved': 0, 'coalesced_probes': 0, 'hedged_probes': 0,
+            'throttled_probes': 0, 'throttle_cuts': 0, 'throttled_hosts': set(), 'failure_classes': {},
+            'hls_validated': 0, 'hls_failed': 0, 'hls_playlist_hits': 0, 'hls_bytes': 0}
+
+def merge_probe_stats(total, stats):
+    """Add one shard's probe counters into total"""
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            merged = total.setdefault(key, {})
+            for inner_key, count in value.items():
+                merged[inner_key] = merged.get(inner_key, 0) + count
+        elif isinstance(value, set):
+            total[key] = total.get(key, set()) | value
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+def run_probe_shard(groups, options, results, cache_config=None, dns_addresses=None, deep_budgets=None):
+    """Worker process entry point: probe one shard, sending each group's result to the parent"""
+    # Nothing is shared with the parent: the cache gets its own SQLite connection
+    cache = ProbeCache(*cache_config) if cache_config else None
+    dns_cache = None
+    if dns_addresses is not None:
+        dns_cache = DnsCache()
+        dns_cache.addresses = dns_addresses
+    hls_validator = HlsValidator(*deep_budgets) if deep_budgets else None
+
+    def send_result(group_data, result):
+        results.put(('result', group_data.original_index, result))
+
+    try:
+        stats = run_probe_phase(groups, send_result, options, cache, dns_cache, hls_validator)
+    except Exception as e:
+        results.put(('error', f"{type(e).__name__}: {e}"))
+        raise
+    finally:
+        if cache:
+            cache.close()
+    results.put(('done', stats))
+
+def run_sharded_probe_phase(groups, on_result, options, processes, cache=None, dns_cache=None, hls_validator=None):
+    """Probe groups across worker processes; results are handed to on_result as they arrive
+
+    Groups are dealt round-robin, so each shard gets a similar mix of hosts.
+    Workers and per-host caps are split between the shards to keep the overall
+    load on each host where a single process would put it.
+    """
+    groups = list(groups)
+    groups_by_index = {group.original_index: group for group in groups}
+
+    def split(limit):
+        return math.ceil(limit / processes) if limit else limit
+
+    shard_options = dict(options, max_workers=split(options['max_workers']), host_limit=split(options['host_limit']),
+                         host_limits={host: split(limit) for host, limit in (options['host_limits'] or {}).items()})
+    if options.get('adaptive_concurrency'):
+        shard_options['adaptive_concurrency'] = tuple(split(limit) for limit in options['adaptive_concurrency'])
+    cache_config = (cache.path, cache.ttl, cache.negative_ttl) if cache else None
+    dns_addresses = dns_cache.addresses if dns_cache else None
+    deep_budgets = (hls_validator.byte_budget, hls_validator.time_budget) if hls_validator else None
+
+    # spawn: children start clean rather than inheriting threads or open sockets
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    workers = [
+        context.Process(target=run_probe_shard, daemon=True,
+                        args=(groups[shard::processes], shard_options, results, cache_config, dns_addresses, deep_budgets))
+        for shard in range(processes) if groups[shard::processes]
+    ]
+
+    # Seeded so the summary has every counter even when no shard ran
+    stats = empty_probe_stats()
+    remaining = len(workers)
+    try:
+        for worker in workers:
+            worker.start()
+        while remaining:
+            try:
+                message = results.get(timeout=1)
+            except queue.Empty:
+                if any(worker.exitcode not in (None, 0) for worker in workers):
+                    raise RuntimeError("A probe worker process died")
+                continue
+
+            if message[0] == 'result':
+                on_result(groups_by_index[message[1]], message[2])
+            elif message[0] == 'done':
+                merge_probe_stats(stats, message[1])
+                remaining -= 1
+            else:
+                raise RuntimeError(f"Probe worker failed: {message[1]}")
+    finally:
+        for worker in workers:
+            if remaining and worker.is_alive():
+                worker.terminate()
+            if worker.pid is not None:
+                worker.join()
+
+    # Deterministic regardless of which shard finished first
+    stats['failure_classes'] = dict(sorted(stats.get('failure_classes', {}).items()))
+    return stats
+
+def parse_address(value):
+    """Parse a HOST:PORT address for argparse"""
+    host, _, port = value.rpartition(':')
+    if not host or not port.isdigit():
+        raise argparse.ArgumentTypeError(f"expected HOST:PORT, got '{value}'")
+    return host, int(port)
+
+# A probing worker sends a heartbeat this often; one silent for the lease
+# timeout is taken as lost (powered off or cut off, which never closes TCP)
+WORKER_HEARTBEAT_INTERVAL = 5
+WORKER_LEASE_TIMEOUT = 30
+
+def run_coordinator_phase(groups, on_result, options, address, authkey, shard_size=100, deep_budgets=None, quiet=False):
+    """Serve groups as shards to remote workers and hand their results to on_result
+
+    Shards are contiguous runs of groups in original order, so the ordered
+    output can flush while later shards are still out. Each worker connection
+    gets a thread; if a worker disconnects, or sends nothing (not even a
+    heartbeat) for WORKER_LEASE_TIMEOUT seconds, before finishing a shard,
+    the shard goes back to the front of the queue for the next worker.
+    Results the lost worker already sent are kept, and repeats are ignored.
+    """
+    groups = list(groups)
+    groups_by_index = {group.original_index: group for group in groups}
+    shards = [groups[start:start + shard_size] for start in range(0, len(groups), shard_size)]
+    pending = deque(range(len(shards)))
+    lock = threading.Lock()
+    events = queue.Queue()  # Messages from connection threads; only this thread records results
+    finished = threading.Event()
+
+    def serve(conn):
+        leased = set()
+        try:
+            while True:
+                if not conn.poll(WORKER_LEASE_TIMEOUT):
+                    break  # Lease expired: the worker is gone without closing the connection
+                message = conn.recv()
+                if message[0] == 'heartbeat':
+                    continue
+                if message[0] == 'get':
+                    with lock:
+                        shard_id = pending.popleft() if pending else None
+                    if shard_id is not None:
+                        leased.add(shard_id)
+                        conn.send(('shard', shard_id, shards[shard_id], options, deep_budgets))
+                    else:
+                        # Idle workers poll, so they can pick up shards re-queued from lost workers
+                        conn.send(('finished',) if finished.is_set() else ('wait',))
+                else:
+                    if message[0] == 'done':
+                        leased.discard(message[1])
+                    events.put(message)
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+            if leased and not finished.is_set():
+                with lock:
+                    pending.extendleft(sorted(leased, reverse=True))
+                events.put(('lost', sorted(leased)))
+
+    def accept():
+        while not finished.is_set():
+            try:
+                conn = listener.accept()
+            except multiprocessing.AuthenticationError:
+                continue
+            except OSError:
+                return
+            events.put(('joined',))
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    listener = Listener(address, authkey=authkey)
+    threading.Thread(target=accept, daemon=True).start()
+    if not quiet:
+        print(f"    Coordinator: serving {len(shards)} shards of up to {shard_size} groups on {address[0]}:{address[1]}")
+
+    # Seeded so the summary has every counter even when no shard ran
+    stats = dict(empty_probe_stats(), workers=0, shards_requeued=0)
+    recorded = set()
+    done_shards = set()
+    try:
+        while len(done_shards) < len(shards):
+            try:
+                # Wake up now and then rather than block for good, so an interrupt gets through
+                message = events.get(timeout=WORKER_HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                continue
+            if message[0] == 'result':
+                _, shard_id, original_index, result = message
+                if original_index not in recorded:
+                    recorded.add(original_index)
+                    on_result(groups_by_index[original_index], result)
+            elif message[0] == 'done' and message[1] not in done_shards:
+                done_shards.add(message[1])
+                merge_probe_stats(stats, message[2])
+            elif message[0] == 'joined':
+                stats['workers'] += 1
+            elif message[0] == 'lost':
+                stats['shards_requeued'] += len(message[1])
+                if not quiet:
+                    print(f"    Coordinator: worker lost, re-queued shards {message[1]}")
+    finally:
+        finished.set()
+        listener.close()
+    return stats
+
+def run_worker(address, authkey, engine='thread', max_workers=20, cache=None, dns_prepass=True, quiet=False):
+    """Pull shards from a coordinator and probe them until it runs out; returns the number of shards probed
+
+    Probe settings come from the coordinator; the engine and -w are this node's own.
+    """
+    conn = Client(address, authkey=authkey)
+    send_lock = threading.Lock()  # Results and heartbeats come from different threads
+    shards_probed = 0
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def heartbeat(shard_id, stop):
+        # Keeps the shard's lease while probing runs, however long results take
+        try:
+            while not stop.wait(WORKER_HEARTBEAT_INTERVAL):
+                send(('heartbeat', shard_id))
+        except (EOFError, OSError):
+            pass
+
+    try:
+        while True:
+            send(('get',))
+            message = conn.recv()
+            if message[0] == 'finished':
+                break
+            if message[0] == 'wait':
+                time.sleep(1)
+                continue
+
+            _, shard_id, groups, options, deep_budgets = message
+            # The lease is kept from here on: the DNS pre-pass alone can outlast it on dead hosts
+            stop = threading.Event()
+            beats = threading.Thread(target=heartbeat, args=(shard_id, stop), daemon=True)
+            beats.start()
+            try:
+                options = dict(options, engine=engine, max_workers=max_workers)
+                dns_cache = None
+                if dns_prepass:
+                    dns_cache = DnsCache()
+                    dns_cache.resolve_all({url_data.host for group_data in groups for url_data in group_data.urls},
+                                          min(100, max(32, max_workers)))
+                hls_validator = HlsValidator(*deep_budgets) if deep_budgets else None
+
+                def send_result(group_data, result):
+                    send(('result', shard_id, group_data.original_index, result))
+
+                stats = run_probe_phase(groups, send_result, options, cache, dns_cache, hls_validator)
+            finally:
+                stop.set()
+                # No heartbeat for this shard may follow its 'done' or the next 'get'
+                beats.join()
+            send(('done', shard_id, stats))
+            shards_probed += 1
+            if not quiet:
+                print(f"    Shard {shard_id}: {len(groups)} groups probed")
+    except (EOFError, OSError):
+        # Coordinator finished (or went away) while we were idle
+        pass
+    finally:
+        conn.close()
+    return shards_probed
+
+def process_all_files(input_files, timeout=10, max_retries=3, max_workers=20, quiet=False, engine='thread',
+                      host_limit=10, host_limits=None, hedge_delay=0, cache=None,
+                      manifest_file=None, refresh_fraction=0.1, retry_backoff=0.5, retry_budget=0.25,
+                      retry_policy=None, run_stats=None, dns_prepass=True, breaker_threshold=5, breaker_cooldown=30,
+                      hls_validator=None, output_file=None, processes=1, coordinator=None, adaptive_timeouts=None,
+                      adaptive_concurrency=None, concurrency_log=None, parse_processes=1, snapshot_file=None):
+    """Process multiple M3U files with cross-file tvg-id grouping
+
+    If run_stats is a dict, it is filled with run counters for the summary.
+    With an hls_validator, working .m3u8 URLs are also deep-checked.
+    With an output_file, working entries are written to it in original order
+    while probing runs, instead of being left to the caller.
+    With processes > 1, groups are probed by that many worker processes.
+    With a coordinator (address, authkey, shard_size), groups are served to
+    remote workers (see run_worker) instead of being probed here.
+    With adaptive_timeouts (floor, ceiling, percentile), each host's timeouts
+    follow its observed latencies (see HostTimeouts).
+    With adaptive_concurrency (minimum, maximum), max_workers is only the
+    starting point for a ConcurrencyController; its per-second limit is
+    written as CSV to concurrency_log if given.
+    With parse_processes > 1, large inputs are parsed in that many processes.
+    With a snapshot_file, parsed entries are reused from it while the input
+    files are unchanged (see collect_all_entries_cached).
+    """
     # Collect all entries from all files
-    all_entries = collect_all_entries(input_files)
+    if snapshot_file:
+        all_entries, from_snapshot = collect_all_entries_cached(input_files, snapshot_file, parse_processes)
+        if from_snapshot and not quiet:
+            print(f"    Sources unchanged, parsed entries loaded from {snapshot_file}")
+    else:
+        all_entries = collect_all_entries(input_files, parse_processes)
     
     # Group entries by tvg-id across all files
     tvg_groups = group_entries_by_tvg_id(all_entries)
@@ -265,72 +2756,297 @@ def process_all_files(input_files, timeout=10, max_retries=3, max_workers=20, qu
     total_urls = len(all_entries)
     
     if not quiet:
-        unique_channels = sum(1 for group in tvg_groups.values() if group['tvg_id'])
-        no_tvg_entries = sum(1 for group in tvg_groups.values() if not group['tvg_id'])
-        multi_url_channels = sum(1 for group in tvg_groups.values() if len(group['urls']) > 1)
-        cross_file_channels = sum(1 for group in tvg_groups.values() if len(set(url['source_file'] for url in group['urls'] if 'source_file' in url)) > 1)
+        unique_channels = sum(1 for group in tvg_groups.values() if group.tvg_id)
+        no_tvg_entries = sum(1 for group in tvg_groups.values() if not group.tvg_id)
+        multi_url_channels = sum(1 for group in tvg_groups.values() if len(group.urls) > 1)
+        cross_file_channels = sum(1 for group in tvg_groups.values() if len(set(url.source_file for url in group.urls)) > 1)
         
         print(f"    Found {unique_channels} unique channels, {no_tvg_entries} entries without tvg-id")
         print(f"    {multi_url_channels} channels have multiple URLs (backup links)")
         print(f"    {cross_file_channels} channels span multiple source files")
-        print(f"    Testing {total_groups} channel groups ({total_urls} total URLs) with {max_workers} workers...")
+        print(f"    Testing {total_groups} channel groups ({total_urls} total URLs) with {max_workers} {engine} workers...")
+    
+    if manifest_file:
+        # Incremental mode: only probe groups that changed since the previous run
+        to_probe, reused, refreshed_count = split_incremental_groups(tvg_groups, load_manifest(manifest_file), refresh_fraction)
+        if not quiet:
+            print(f"    Incremental: {len(to_probe) - refreshed_count} new/changed groups, {refreshed_count} refreshed, {len(reused)} reused from previous run")
+    else:
+        to_probe, reused = tvg_groups.values(), []
     
     working_entries = []
     completed_count = 0
+    new_manifest = {}
+    writer = None
+    if output_file:
+        writer = OrderedPlaylistWriter(output_file, sorted(group.original_index for group in tvg_groups.values()))
     
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_group = {executor.submit(check_urls_for_group, group_data, timeout, max_retries): group_data for group_data in tvg_groups.values()}
+    def record_result(group_data, result, checked_at=None):
+        nonlocal completed_count
+        completed_count += 1
+        
+        if manifest_file:
+            new_manifest[group_manifest_key(group_data)] = {
+                'urls': [url_data.url for url_data in group_data.urls],
+                'working_url': result['url'] if result else None,
+                'checked_at': checked_at or time.time()
+            }
         
-        for future in as_completed(future_to_group):
-            group_data = future_to_group[future]
-            result = future.result()
-            completed_count += 1
+        # Show progress every 5 completions for better UX
+        if not quiet and completed_count % 5 == 0:
+            progress = (completed_count / total_groups) * 100
+            print(f"    Progress: {completed_count}/{total_groups} channel groups ({progress:.1f}%)")
+        
+        if result:
+            # Source file info already in entry from collect_all_entries
+            # Add source prefix to group-title using the source file from first working URL
+            working_url_source = None
+            for url_data in group_data.urls:
+                if url_data.url == result['url']:
+                    working_url_source = url_data.source_file or 'unknown'
+                    break
             
-            # Show progress every 5 completions for better UX
-            if not quiet and completed_count % 5 == 0:
-                progress = (completed_count / total_groups) * 100
-                print(f"    Progress: {completed_count}/{total_groups} channel groups ({progress:.1f}%)")
+            # The output entry is the first occurrence's metadata with the working URL
+            result['metadata_entry'] = group_data.urls[0]
+            result['url_entry'] = url_data
+            if working_url_source:
+                result['source_prefix'] = get_source_prefix(working_url_source)
+                result['source_file'] = working_url_source
             
-            if result:
-                # Source file info already in entry from collect_all_entries
-                # Add source prefix to group-title using the source file from first working URL
-                working_url_source = None
-                for url_data in group_data['urls']:
-                    if url_data['url'] == result['url']:
-                        working_url_source = url_data.get('source_file', group_data.get('source_file', 'unknown'))
-                        break
-                
-                if working_url_source:
-                    source_prefix = get_source_prefix(working_url_source)
-                    result['metadata'] = add_source_prefix_to_group_title(result['metadata'], source_prefix)
-                    result['source_file'] = working_url_source
-                
-                working_entries.append(result)
+            working_entries.append(result)
+        
+        if writer:
+            writer.add(group_data.original_index, result)
+    
+    # From here on a failure drops the writer's temp file, leaving any previous output in place
+    try:
+        # Unchanged groups keep their previous outcome, rebuilt on today's metadata
+        for group_data, previous in reused:
+            result = None
+            for url_data in group_data.urls:
+                if url_data.url == previous['working_url']:
+                    result = build_group_result(group_data, url_data, "✓ Working (unchanged)")
+                    break
+            record_result(group_data, result, previous['checked_at'])
+    
+        # DNS phase: resolve every host once, so dead hosts fail without taking a worker slot
+        dns_started = time.monotonic()
+        dns_cache = None
+        # Remote workers resolve from their own network, so a coordinator skips this
+        if dns_prepass and not coordinator:
+            dns_cache = DnsCache()
+            dns_cache.resolve_all({url_data.host for group_data in to_probe for url_data in group_data.urls},
+                                  min(100, max(32, max_workers)))
+        dns_seconds = time.monotonic() - dns_started
+    
+        if not quiet and dns_cache:
+            print(f"    DNS: resolved {len(dns_cache.addresses)} hosts ({dns_cache.unresolvable_count()} unresolvable) in {dns_seconds:.1f}s")
+    
+        probe_started = time.monotonic()
+        options = {
+            'engine': engine, 'timeout': timeout, 'max_workers': max_workers, 'host_limit': host_limit,
+            'host_limits': host_limits, 'hedge_delay': hedge_delay, 'max_retries': max_retries,
+            'retry_backoff': retry_backoff, 'retry_budget': retry_budget, 'retry_policy': retry_policy,
+            'breaker_threshold': breaker_threshold, 'breaker_cooldown': breaker_cooldown,
+            'adaptive_timeouts': adaptive_timeouts, 'adaptive_concurrency': adaptive_concurrency,
+        }
+        if coordinator:
+            address, authkey, shard_size = coordinator
+            deep_budgets = (hls_validator.byte_budget, hls_validator.time_budget) if hls_validator else None
+            stats = run_coordinator_phase(to_probe, record_result, options, address, authkey, shard_size, deep_budgets, quiet)
+        elif processes > 1:
+            stats = run_sharded_probe_phase(to_probe, record_result, options, processes, cache, dns_cache, hls_validator)
+        else:
+            stats = run_probe_phase(to_probe, record_result, options, cache, dns_cache, hls_validator)
+    except BaseException:
+        if writer:
+            writer.abort()
+        raise
+    probe_seconds = time.monotonic() - probe_started
+    if writer:
+        writer.close()
+    
+    if manifest_file:
+        save_manifest(new_manifest, manifest_file)
+    
+    timeline = sorted(stats.get('concurrency_timeline', {}).items())
+    if concurrency_log and timeline:
+        with open(concurrency_log, 'w', encoding='utf-8') as f:
+            f.write("second,concurrency\n")
+            for second, limit in timeline:
+                f.write(f"{second},{limit}\n")
     
     if not quiet:
         working_channels = len(working_entries)
         print(f"    Result: {working_channels} working channels from {total_groups} channel groups")
+        if coordinator:
+            print(f"    Distributed: {stats['workers']} workers connected, {stats['shards_requeued']} shards re-queued from lost workers")
+        elif processes > 1:
+            print(f"    Processes: {processes} shards probed in parallel")
+        print(f"    Connections: {stats['connections_reused']} reused, {stats['connections_opened']} opened")
+        if 'http2_requests' in stats:
+            print(f"    HTTP/2: {stats['http2_requests']} probes sent as multiplexed streams")
+        print(f"    Retries: {stats['retries']} scheduled, {stats['retries_over_budget']} skipped by retry budget")
+        print(f"    Method ladder: {stats['method_fallbacks']} fallbacks, {len(stats['get_hosts'])} hosts probed with GET")
+        if dns_cache:
+            print(f"    DNS fast failures: {stats['dns_fast_failures']} probes skipped on unresolvable hosts")
+        if breaker_threshold:
+            print(f"    Circuit breaker: {stats['circuits_opened']} origins opened, {stats['circuit_fast_failures']} probes failed fast")
+        print(f"    Single-flight: {stats['probes_saved']} probes saved on repeated URLs, "
+              f"{stats['coalesced_probes']} waited on an identical probe in flight")
+        if 'concurrency_peak' in stats:
+            print(f"    Concurrency: {stats['concurrency_initial']} -> {stats['concurrency_final']} probes in flight "
+                  f"(peak {stats['concurrency_peak']}), {stats['concurrency_increases']} increases, "
+                  f"{stats['concurrency_decreases']} decreases")
+            if timeline:
+                samples = timeline[::math.ceil(len(timeline) / 12)]
+                print(f"    Concurrency over time: {' '.join(f'{second}s:{limit}' for second, limit in samples)}")
+        if adaptive_timeouts:
+            print(f"    Adaptive timeouts: {len(stats.get('adaptive_hosts', ()))} hosts tuned, "
+                  f"{stats.get('early_timeouts', 0)} probes timed out before the {timeout}s default")
+        if stats.get('throttled_probes'):
+            print(f"    Throttling: {stats['throttled_probes']} probes parked on 429/503, "
+                  f"{stats['throttle_cuts']} rate cuts across {len(stats['throttled_hosts'])} hosts")
+        if hedge_delay:
+            print(f"    Hedged backups: {stats['hedged_probes']} started early after {hedge_delay}s")
+        if cache:
+            print(f"    Probe cache: {stats.get('cache_hits', 0)} hits, {stats.get('cache_misses', 0)} misses")
+        if writer and writer.first_write is not None:
+            print(f"    Streaming output: first entries written after {writer.first_write:.1f}s, at most {writer.max_buffered} results buffered")
+        if hls_validator:
+            print(f"    Deep HLS: {stats['hls_validated']} playlists checked, {stats['hls_failed']} failed, "
+                  f"{stats['hls_playlist_hits']} shared playlist hits, {stats['hls_bytes'] // 1024} KiB fetched")
+    
+    if run_stats is not None:
+        run_stats['failure_classes'] = stats['failure_classes']
+        run_stats['phases'] = {'dns': dns_seconds, 'probing': probe_seconds}
     
     # Sort by original order
     working_entries.sort(key=lambda x: x['original_index'])
     return working_entries, total_urls
 
-def process_single_file(file_path, timeout=10, max_retries=3, max_workers=20, quiet=False):
+def process_single_file(file_path, timeout=10, max_retries=3, max_workers=20, quiet=False, engine='thread',
+                        host_limit=10, host_limits=None, hedge_delay=0, cache=None,
+                        manifest_file=None, refresh_fraction=0.1, retry_backoff=0.5, retry_budget=0.25,
+                        retry_policy=None, run_stats=None, dns_prepass=True, breaker_threshold=5, breaker_cooldown=30,
+                        hls_validator=None, output_file=None, processes=1, coordinator=None, adaptive_timeouts=None,
+                        adaptive_concurrency=None, concurrency_log=None, parse_processes=1, snapshot_file=None):
     """Process a single M3U file (backward compatibility)"""
-    return process_all_files([file_path], timeout, max_retries, max_workers, quiet)
+    return process_all_files([file_path], timeout, max_retries, max_workers, quiet, engine, host_limit, host_limits, hedge_delay, cache,
+                             manifest_file, refresh_fraction, retry_backoff, retry_budget, retry_policy, run_stats, dns_prepass,
+                             breaker_threshold, breaker_cooldown, hls_validator, output_file, processes, coordinator, adaptive_timeouts,
+                             adaptive_concurrency, concurrency_log, parse_processes, snapshot_file)
 
 def main():
     parser = argparse.ArgumentParser(description='Check M3U playlist URLs and create filtered playlist')
-    parser.add_argument('input_path', help='Input M3U file or folder containing M3U files')
+    parser.add_argument('input_path', nargs='?', help='Input M3U file or folder containing M3U files (not used with --worker)')
     parser.add_argument('-o', '--output', help='Output file for working entries (default: auto-detect based on input)')
-    parser.add_argument('-w', '--workers', type=int, default=20, help='Number of worker threads (default: 20)')
+    parser.add_argument('-w', '--workers', type=int, default=20, help='Number of worker threads, or in-flight probes with --engine async/http2 (default: 20)')
+    parser.add_argument('--adaptive-concurrency', action='store_true',
+                        help='Adjust in-flight probes during the run (AIMD), starting from -w')
+    parser.add_argument('--concurrency-min', type=int, default=4,
+                        help='With --adaptive-concurrency, fewest probes kept in flight (default: 4)')
+    parser.add_argument('--concurrency-max', type=int, default=200,
+                        help='With --adaptive-concurrency, most probes kept in flight (default: 200)')
+    parser.add_argument('--concurrency-log', metavar='FILE',
+                        help='With --adaptive-concurrency, write the per-second concurrency limit to FILE as CSV')
     parser.add_argument('-t', '--timeout', type=int, default=10, help='Request timeout in seconds (default: 10)')
     parser.add_argument('-r', '--retries', type=int, default=3, help='Max retries for failed URLs (default: 3)')
+    parser.add_argument('--adaptive-timeouts', action='store_true',
+                        help='Derive per-host timeouts from observed latencies instead of using -t for every probe; '
+                             'the connect timeout is the derived read timeout capped at -t')
+    parser.add_argument('--timeout-floor', type=float, default=1.0, metavar='SECONDS',
+                        help='With --adaptive-timeouts, shortest timeout given to any host (default: 1.0)')
+    parser.add_argument('--timeout-ceiling', type=float, default=30, metavar='SECONDS',
+                        help='With --adaptive-timeouts, longest read timeout given to a slow host (default: 30)')
+    parser.add_argument('--timeout-percentile', type=float, default=95, metavar='P',
+                        help='With --adaptive-timeouts, latency percentile a host\'s timeout is based on (default: 95)')
+    parser.add_argument('--retry-backoff', type=float, default=0.5, metavar='SECONDS',
+                        help='Base delay before a retry, doubled per attempt with jitter (default: 0.5)')
+    parser.add_argument('--retry-budget', type=float, default=0.25,
+                        help='Max retries as a share of first attempts across the run (default: 0.25)')
+    parser.add_argument('--retry-policy', type=parse_retry_policy_override, action='append', default=[], metavar='CLASS=RETRIES[:DELAY]',
+                        help=f"Override retries/base delay for an error class: {', '.join(RETRY_POLICY)} (repeatable)")
+    parser.add_argument('--no-dns-prepass', dest='dns_prepass', action='store_false',
+                        help='Skip resolving all hosts up front; each probe resolves its own host')
+    parser.add_argument('--breaker-threshold', type=int, default=5,
+                        help='Consecutive connection failures/timeouts that open a host:port circuit, 0 to disable (default: 5)')
+    parser.add_argument('--breaker-cooldown', type=float, default=30, metavar='SECONDS',
+                        help='Seconds an open circuit fails fast before a trial probe (default: 30)')
+    parser.add_argument('-p', '--processes', type=int, default=1,
+                        help='Worker processes to shard channel groups across; -w and host limits are split between them (default: 1)')
+    parser.add_argument('--parse-processes', type=int, default=os.cpu_count() or 1,
+                        help='Processes to parse large inputs with, by file and by chunk of a big file; 1 parses in this process (default: CPU count)')
+    parser.add_argument('--snapshot-file',
+                        help='Parsed-source snapshot, reused while the inputs are unchanged (default: .<input name>.snapshot next to the input)')
+    parser.add_argument('--no-snapshot', dest='snapshot', action='store_false',
+                        help='Always parse the inputs, without reading or writing a snapshot')
+    parser.add_argument('--coordinator', type=parse_address, metavar='HOST:PORT',
+                        help='Serve the grouped channels as shards to --worker nodes on this address instead of probing locally')
+    parser.add_argument('--worker', type=parse_address, metavar='HOST:PORT',
+                        help='Probe shards pulled from the coordinator at this address (uses this node\'s -e/-w/--cache-*)')
+    parser.add_argument('--shard-size', type=int, default=100,
+                        help='With --coordinator, channel groups per shard (default: 100)')
+    parser.add_argument('--authkey', default=os.environ.get('CHECK_PLAYLIST_AUTHKEY'),
+                        help='Shared secret for --coordinator/--worker (default: $CHECK_PLAYLIST_AUTHKEY)')
+    parser.add_argument('--benchmark-memory', action='store_true',
+                        help='Only parse and group the input, then report the memory it took (no probing, no output)')
     parser.add_argument('-q', '--quiet', action='store_true', help='Suppress detailed output')
+    parser.add_argument('-e', '--engine', choices=sorted(ENGINES), default='thread', help='Probe engine: thread pool, asyncio event loop, or asyncio over multiplexed HTTP/2 (default: thread)')
+    parser.add_argument('--host-limit', type=int, default=10, help='Max in-flight probes per host, 0 for no cap (default: 10)')
+    parser.add_argument('--host-limit-for', type=parse_host_limit_override, action='append', default=[], metavar='HOST=N',
+                        help='Per-host override of --host-limit; also applies to subdomains (repeatable)')
+    parser.add_argument('--hedge-delay', type=float, default=0, metavar='SECONDS',
+                        help='Also start the next backup URL once the current one has run this long, 0 to disable (default: 0)')
+    parser.add_argument('--cache-ttl', type=float, default=0, metavar='SECONDS',
+                        help='Reuse cached working results younger than this, 0 disables the probe cache (default: 0)')
+    parser.add_argument('--cache-negative-ttl', type=float, default=0, metavar='SECONDS',
+                        help='Reuse cached failed results younger than this (default: 0)')
+    parser.add_argument('--cache-file', help='Probe cache database (default: .probe_cache.sqlite next to the output file)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only probe channels whose URLs changed since the last --incremental run, reusing earlier results')
+    parser.add_argument('--refresh-fraction', type=float, default=0.1,
+                        help='With --incremental, share of unchanged channels re-checked anyway, oldest first (default: 0.1)')
+    parser.add_argument('--deep', action='store_true',
+                        help='Also validate working .m3u8 URLs: master playlist, one media playlist and the first segment')
+    parser.add_argument('--deep-byte-budget', type=int, default=256 * 1024, metavar='BYTES',
+                        help='With --deep, max bytes downloaded to validate one URL (default: 262144)')
+    parser.add_argument('--deep-time-budget', type=float, default=15, metavar='SECONDS',
+                        help='With --deep, max seconds spent validating one URL (default: 15)')
     
     args = parser.parse_args()
     
+    if args.engine == 'async' and aiohttp is None:
+        print("Error: --engine async requires aiohttp (pip install aiohttp)")
+        sys.exit(1)
+    if args.engine == 'http2' and httpx is None:
+        print("Error: --engine http2 requires httpx with HTTP/2 support (pip install 'httpx[http2]')")
+        sys.exit(1)
+    if (args.coordinator or args.worker) and not args.authkey:
+        print("Error: --coordinator/--worker need a shared secret (--authkey or CHECK_PLAYLIST_AUTHKEY)")
+        sys.exit(1)
+    
+    if args.worker:
+        cache = None
+        if args.cache_ttl > 0:
+            cache = ProbeCache(args.cache_file or '.probe_cache.sqlite', args.cache_ttl, args.cache_negative_ttl)
+        try:
+            shards = run_worker(args.worker, args.authkey.encode(), args.engine, args.workers, cache, args.dns_prepass, args.quiet)
+        except multiprocessing.AuthenticationError:
+            print(f"Error: coordinator at {args.worker[0]}:{args.worker[1]} rejected the authkey")
+            sys.exit(1)
+        except ConnectionRefusedError:
+            print(f"Error: no coordinator listening on {args.worker[0]}:{args.worker[1]}")
+            sys.exit(1)
+        finally:
+            if cache:
+                cache.close()
+        print(f"Worker finished: {shards} shards probed for {args.worker[0]}:{args.worker[1]}")
+        return shards
+    
     # Validate input path
+    if not args.input_path:
+        parser.error('input_path is required unless --worker is given')
     if not os.path.exists(args.input_path):
         print(f"Error: Input path '{args.input_path}' not found!")
         sys.exit(1)
@@ -364,6 +3080,12 @@ def main():
             folder_name = os.path.basename(args.input_path.rstrip('/'))
             output_file = f"{folder_name}_working.m3u"
     
+    if args.benchmark_memory:
+        result = benchmark_parse_memory(input_files, max(1, args.parse_processes))
+        print(f"Parsed {result['entries']} entries into {result['groups']} channel groups in {result['seconds']:.2f}s")
+        print(f"Memory: {result['current_bytes'] / 2**20:.1f} MiB held, {result['peak_bytes'] / 2**20:.1f} MiB peak")
+        return result
+    
     if not args.quiet:
         if len(input_files) == 1:
             print(f"Checking URLs in {input_files[0]}...")
@@ -371,18 +3093,58 @@ def main():
             print(f"Checking URLs in {len(input_files)} M3U files from {args.input_path}...")
         print("=" * 80)
     
+    # Parsed sources are snapshotted next to the input, keyed by its content
+    snapshot_file = None
+    if args.snapshot:
+        input_path = os.path.abspath(args.input_path)
+        snapshot_file = args.snapshot_file or os.path.join(os.path.dirname(input_path), f".{os.path.basename(input_path)}.snapshot")
+    
+    # The manifest records each channel's URLs and outcome for the next incremental run
+    manifest_file = f"{os.path.splitext(output_file)[0]}.manifest.json" if args.incremental else None
+    
+    cache = None
+    if args.cache_ttl > 0:
+        cache_file = args.cache_file or os.path.join(os.path.dirname(os.path.abspath(output_file)), '.probe_cache.sqlite')
+        cache = ProbeCache(cache_file, args.cache_ttl, args.cache_negative_ttl)
+    
     # Process all files with cross-file tvg-id grouping
     if not args.quiet:
         print(f"\nProcessing all files with cross-file channel grouping...")
     
-    all_working_entries, total_entries = process_all_files(input_files, args.timeout, args.retries, args.workers, args.quiet)
+    run_stats = {}
+    try:
+        all_working_entries, total_entries = process_all_files(
+            input_files, args.timeout, args.retries, args.workers, args.quiet, args.engine,
+            host_limit=args.host_limit,
+            host_limits=dict(args.host_limit_for),
+            hedge_delay=args.hedge_delay,
+            cache=cache,
+            manifest_file=manifest_file,
+            refresh_fraction=args.refresh_fraction,
+            retry_backoff=args.retry_backoff,
+            retry_budget=args.retry_budget,
+            retry_policy=dict(args.retry_policy),
+            run_stats=run_stats,
+            dns_prepass=args.dns_prepass,
+            breaker_threshold=args.breaker_threshold,
+            breaker_cooldown=args.breaker_cooldown,
+            hls_validator=HlsValidator(args.deep_byte_budget, args.deep_time_budget) if args.deep else None,
+            output_file=output_file,
+            processes=max(1, args.processes),
+            coordinator=(args.coordinator, args.authkey.encode(), max(1, args.shard_size)) if args.coordinator else None,
+            adaptive_timeouts=(args.timeout_floor, args.timeout_ceiling, args.timeout_percentile) if args.adaptive_timeouts else None,
+            adaptive_concurrency=(args.concurrency_min, args.concurrency_max) if args.adaptive_concurrency else None,
+            concurrency_log=args.concurrency_log,
+            parse_processes=max(1, args.parse_processes),
+            snapshot_file=snapshot_file
+        )
+    finally:
+        if cache:
+            cache.close()
     
     total_working = len(all_working_entries)
     total_failed = total_entries - total_working
     
-    # Write consolidated M3U file
-    write_filtered_m3u(all_working_entries, output_file)
-    
     if not args.quiet:
         print("\n" + "=" * 80)
     
@@ -395,7 +3157,14 @@ def main():
     
     print(f"✓ Working URLs: {total_working}")
     print(f"✗ Failed URLs: {total_failed}")
+    failure_classes = run_stats.get('failure_classes')
+    if failure_classes:
+        breakdown = ", ".join(f"{error_class} {count}" for error_class, count in sorted(failure_classes.items(), key=lambda item: -item[1]))
+        print(f"  Probed URL failures by class: {breakdown}")
     print(f"Total URLs: {total_entries}")
+    phases = run_stats.get('phases')
+    if phases:
+        print("Phases: " + ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in phases.items()))
     print(f"Success Rate: {(total_working/total_entries*100):.1f}%")
     print(f"Consolidated playlist written to: {output_file}")
     
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# check_playlist is a script in src/, not an installed package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
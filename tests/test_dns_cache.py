@@ -0,0 +1,82 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import check_playlist as cp
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_GET = do_HEAD
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), OkHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def run_engine(engine, port):
+    """Probe one URL on `localhost` with a pre-filled DnsCache; return (status, real resolver calls)"""
+    real_calls = []
+    real_getaddrinfo = socket.getaddrinfo
+
+    def spy(*args):
+        real_calls.append(args)
+        return real_getaddrinfo(*args)
+
+    dns_cache = cp.DnsCache()
+    dns_cache.real_getaddrinfo = spy
+    dns_cache.addresses['localhost'] = real_getaddrinfo('127.0.0.1', None, socket.AF_INET, socket.SOCK_STREAM)
+
+    url = f'http://localhost:{port}/live.m3u8'
+    group = cp.ChannelGroup('x', [cp.PlaylistEntry(None, 0, url, 'x', 0, 'a.m3u', 'localhost')], 0)
+    options = dict(engine=engine, timeout=3, max_workers=4, host_limit=10, host_limits={}, hedge_delay=0, max_retries=1,
+                   retry_backoff=0.5, retry_budget=0.25, retry_policy={}, breaker_threshold=5, breaker_cooldown=30)
+    results = []
+    cp.run_probe_phase([group], lambda group_data, result: results.append(result), options, None, dns_cache)
+    return results[0]['status'], real_calls
+
+
+@pytest.mark.parametrize('engine', ['thread', 'async', 'http2'])
+def test_probes_answer_from_the_prepass(server, engine):
+    if engine == 'async' and cp.aiohttp is None:
+        pytest.skip('aiohttp not installed')
+    if engine == 'http2' and cp.httpx is None:
+        pytest.skip('httpx[http2] not installed')
+    status, real_calls = run_engine(engine, server)
+    assert status.startswith('✓')
+    assert real_calls == []
+
+
+def test_harmless_flags_still_hit_the_cache():
+    dns_cache = cp.DnsCache()
+    dns_cache.real_getaddrinfo = lambda *args: pytest.fail(f'reached the real resolver: {args}')
+    dns_cache.addresses['example.test'] = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('192.0.2.1', 0))]
+    infos = dns_cache.getaddrinfo('example.test', 80, 0, socket.SOCK_STREAM, 0, socket.AI_ADDRCONFIG)
+    assert infos[0][4] == ('192.0.2.1', 80)
+
+
+def test_bytes_hosts_hit_the_cache():
+    # httpx (through anyio) passes the host IDNA-encoded
+    dns_cache = cp.DnsCache()
+    dns_cache.real_getaddrinfo = lambda *args: pytest.fail(f'reached the real resolver: {args}')
+    dns_cache.addresses['bücher.test'] = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('192.0.2.2', 0))]
+    infos = dns_cache.getaddrinfo('bücher.test'.encode('idna'), 443, 0, socket.SOCK_STREAM)
+    assert infos[0][4] == ('192.0.2.2', 443)
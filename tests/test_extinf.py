@@ -0,0 +1,43 @@
+import pytest
+
+import check_playlist as cp
+
+# Malformed headers seen in real playlists, with the tvg-id the old whole-line search found
+MALFORMED_HEADERS = [
+    ('#EXTINF:-1 tvg-name="A", tvg-id="a.pk" group-title="News",A', 'a.pk'),  # Comma between attributes
+    ('#EXTINF:-1 tvg-name="A tvg-id="a.pk" group-title="News",A', 'a.pk'),  # Unbalanced quote
+    ('#EXTINF:-1 tvg-name="A" "HD" tvg-id="a.pk" group-title="News",A', 'a.pk'),  # Stray quoted word
+]
+
+
+@pytest.mark.parametrize('line, tvg_id', MALFORMED_HEADERS)
+def test_tokenizer_scans_past_malformed_attributes(line, tvg_id):
+    extinf = cp.parse_extinf(line)
+    assert extinf.get('tvg-id') == tvg_id
+    assert extinf.get('group-title') == 'News'
+    assert extinf.name == 'A'
+
+
+@pytest.mark.parametrize('line, tvg_id', MALFORMED_HEADERS)
+def test_parse_keeps_tvg_id_of_malformed_headers(tmp_path, line, tvg_id):
+    playlist = tmp_path / 'in.m3u'
+    playlist.write_text(f'#EXTM3U\n{line}\nhttp://example.test/a.m3u8\n')
+    offsets, urls, tvg_ids, hosts = cp.parse_m3u_span(str(playlist))
+    assert tvg_ids == [tvg_id]
+
+
+def test_every_group_title_is_rewritten():
+    line = '#EXTINF:-1 tvg-id="a.pk" group-title="News" group-title=Sports,A'
+    (rewritten,) = cp.add_source_prefix_to_group_title([line], 'Pakistani')
+    assert rewritten == '#EXTINF:-1 tvg-id="a.pk" group-title="Pakistani News" group-title="Pakistani Sports",A'
+
+
+def test_unquoted_value_is_written_quoted():
+    extinf = cp.parse_extinf('#EXTINF:-1 tvg-id="a.pk" group-title=Cr,A')
+    assert extinf.replace('group-title', 'Cr Sports') == '#EXTINF:-1 tvg-id="a.pk" group-title="Cr Sports",A'
+
+
+def test_attribute_like_text_in_the_title_keeps_the_name():
+    extinf = cp.parse_extinf('#EXTINF:-1 tvg-id="a.pk",Movie a="b"')
+    assert extinf.get('tvg-id') == 'a.pk'
+    assert extinf.name == 'Movie a="b"'